@@ -1,38 +1,114 @@
 import os
-from flask import Flask, jsonify
+import threading
+from flask import Flask, jsonify, send_from_directory
 from flask_cors import CORS
 from config import Config
 from models import db
-from database import init_database
+from database import init_database, prepare_database
 from routes import api
-import os
 
 def create_app():
     """Create and configure the Flask application"""
     app = Flask(__name__)
     app.config.from_object(Config)
     
+    # Behind a load balancer the client IP (used by the auth rate limits)
+    # comes from X-Forwarded-For, trusted for PROXY_COUNT hops
+    if app.config['PROXY_COUNT']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_COUNT'], x_proto=app.config['PROXY_COUNT'])
+    
+    # orjson-backed JSON when installed, ISO 8601 dates either way
+    from serializers import FastJSONProvider
+    app.json = FastJSONProvider(app)
+    
+    # Request latency and SQL per route on /metrics; registered before
+    # compression so the timings include it
+    from metrics import init_metrics
+    init_metrics(app)
+    
+    # gzip/brotli for JSON, exports and the frontend, never for photos
+    from compression import init_compression
+    init_compression(app)
+    
     # Enable CORS for frontend
     CORS(app, 
      supports_credentials=True,
      origins=["*"],  # Allow all for now
      allow_headers=["Content-Type"],
-     methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
+     methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"])
    
     
     # Initialize database
     db.init_app(app)
-    
-    # Initialize mail
-    from utils import mail
-    mail.init_app(app)
+    init_database(app)
     
     # Register blueprints
     app.register_blueprint(api, url_prefix='/api')
     
-    # Initialize database tables
-    with app.app_context():
-        init_database(app)
+    # Schema upgrade and the background email/SMS sender wait for the first
+    # request, so building the app does no database or thread work
+    from outbox import start_outbox_sender, drain_outbox, make_backend
+    from jobs import sweep_stuck_photos
+    started = threading.Event()
+    start_lock = threading.Lock()
+    
+    @app.before_request
+    def start_up():
+        if started.is_set():
+            return
+        with start_lock:
+            if started.is_set():
+                return
+            prepare_database(app)
+            try:
+                sweep_stuck_photos(app)
+            except Exception as e:
+                print(f"Error sweeping stuck photos: {e}")
+            if app.config['OUTBOX_AUTOSTART']:
+                start_outbox_sender(app)
+            started.set()
+    
+    @app.cli.command('send-outbox')
+    def send_outbox():
+        """Deliver every message that is due, then exit"""
+        backend = make_backend(app)
+        try:
+            total = 0
+            while True:
+                claimed = drain_outbox(app, backend)
+                total += claimed
+                if not claimed:
+                    break
+            print(f"Sent {total} outbox message(s)")
+        finally:
+            backend.close()
+    
+    @app.cli.command('sweep-photos')
+    def sweep_photos():
+        """Mark photos whose processing job was lost as failed"""
+        print(f"Marked {sweep_stuck_photos(app)} stuck photo(s) as failed")
+    
+    @app.cli.command('send-reminders')
+    def send_reminders():
+        """Queue reminders for deliveries and boosters due soon (run daily)"""
+        from reminders import send_due_reminders
+        print(f"Queued reminders for {send_due_reminders(app)} event(s)")
+    
+    @app.cli.command('rebuild-reminders')
+    def rebuild_reminders():
+        """Recompute every animal's upcoming events"""
+        from reminders import rebuild_all_events
+        print(f"Rebuilt events for {rebuild_all_events(app)} animal(s)")
+    
+    @app.cli.command('rebuild-stats')
+    def rebuild_stats():
+        """Recount every user's herd statistics from the animals table"""
+        from stats import recount
+        with app.app_context():
+            recount()
+            db.session.commit()
+        print("Herd statistics rebuilt")
     
     # Health check route
     @app.route('/')
@@ -43,14 +119,21 @@ def create_app():
             'version': '1.0.0'
         })
     
+    @app.route('/app/')
+    def frontend():
+        return send_from_directory(app.config['FRONTEND_FOLDER'], 'index.html')
+    
     @app.route('/health')
     def health():
         return jsonify({'status': 'healthy'}), 200
     
     return app
 
+# Built once, for gunicorn, the flask CLI and running this file directly
+app = create_app()
+
 if __name__ == '__main__':
-    app = create_app()
+    prepare_database(app)
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('FLASK_ENV') == 'development'
     
@@ -60,7 +143,4 @@ if __name__ == '__main__':
     print("🌐 Server: http://localhost:5000")
     print("🔌 API: http://localhost:5000/api")
     print("="*50)
-    app.run(debug=debug, host='0.0.0.0', port=port)
-
-# Create app for gunicorn
-app = create_app()
\ No newline at end of file
+    app.run(debug=debug, host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,5 @@
+"""Benchmarks for the NAAM backend
+
+Run from the Backend folder, e.g. ``python -m benchmarks.bench_indexes``.
+Each benchmark builds the app against its own throwaway database.
+"""
@@ -0,0 +1,238 @@
+"""API latency and throughput per endpoint
+
+--users synthetic users with --animals animals between them are seeded,
+then each endpoint gets --requests requests from --concurrency threads,
+each signed in as one of the users. The 'client' target drives the app
+in this process through the Flask test client; the 'gunicorn' target
+starts a local gunicorn on the same database and sends real HTTP.
+Email and SMS go to the console outbox backend, so nothing is sent, and
+the auth rate limits are off so repeated logins are measured.
+
+    python -m benchmarks.bench_api --animals 100000 --users 10 --target both --output api.json
+    python -m benchmarks.compare before.json api.json
+"""
+import argparse
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from http.cookiejar import CookieJar
+
+from benchmarks.common import BACKEND_DIR, latency_stats, make_app, seed, write_results
+
+
+def make_photo(width=1600, height=1200):
+    """JPEG bytes of a noisy test image, roughly phone-camera sized"""
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.effect_noise((width, height), 48).convert('RGB').save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def endpoints(photo):
+    """Endpoint name -> fn(user) returning (method, path, body, headers)"""
+    json_headers = {'Content-Type': 'application/json'}
+    return {
+        'login': lambda user: ('POST', '/api/login', json.dumps(
+            {'email': user['email'], 'password': 'benchmark'}), json_headers),
+        'list_animals': lambda user: ('GET', '/api/animals?limit=50', None, {}),
+        'list_animals_injections': lambda user: ('GET', '/api/animals?limit=50&include=injections', None, {}),
+        'search': lambda user: ('GET', '/api/animals/search?q=limping', None, {}),
+        'stats': lambda user: ('GET', '/api/stats', None, {}),
+        'create_animal': lambda user: ('POST', '/api/animals', json.dumps({
+            'name': 'Bench', 'type': 'Cow', 'inseminatedDate': '2024-01-01',
+            'injections': [{'date': '2024-02-01', 'details': 'FMD vaccine'}]
+        }), json_headers),
+        'photo_upload': lambda user: ('PUT', f"/api/animals/{user['animal_id']}/photo", photo,
+                                      {'Content-Type': 'image/jpeg'})
+    }
+
+
+class ClientSession:
+    """A signed-in Flask test client"""
+
+    def __init__(self, app, user):
+        self.client = app.test_client()
+        self('POST', '/api/login', json.dumps({'email': user['email'], 'password': 'benchmark'}),
+             {'Content-Type': 'application/json'})
+
+    def __call__(self, method, path, body, headers):
+        response = self.client.open(path, method=method, data=body, headers=headers)
+        response.get_data()
+        return response.status_code
+
+
+class HTTPSession:
+    """A signed-in HTTP client with its own cookie jar"""
+
+    def __init__(self, base_url, user):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+        self('POST', '/api/login', json.dumps({'email': user['email'], 'password': 'benchmark'}).encode(),
+             {'Content-Type': 'application/json'})
+
+    def __call__(self, method, path, body, headers):
+        if isinstance(body, str):
+            body = body.encode()
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+def run_endpoint(sessions, users, build, requests, warmup):
+    """Send requests spread over one thread per session, returns stats"""
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    per_thread = max(1, requests // len(sessions))
+
+    def worker(index):
+        send, user = sessions[index], users[index % len(users)]
+        for _ in range(warmup):
+            send(*build(user))
+        local = []
+        local_statuses = {}
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            status = send(*build(user))
+            local.append((time.perf_counter() - started) * 1000)
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+        with lock:
+            latencies.extend(local)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(sessions))]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return dict(
+        requests=len(latencies),
+        errors=sum(count for status, count in statuses.items() if status >= 400),
+        statuses={str(status): count for status, count in sorted(statuses.items())},
+        throughput_rps=round(len(latencies) / elapsed, 1),
+        **latency_stats(latencies)
+    )
+
+
+def run_target(make_session, users, names, photo, args):
+    sessions = [make_session(users[i % len(users)]) for i in range(args.concurrency)]
+    builders = endpoints(photo)
+    return {name: run_endpoint(sessions, users, builders[name], args.requests, args.warmup) for name in names}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(database_url, workers, threads, mode=None, env=None):
+    """Start gunicorn with gunicorn.conf.py, returns (process, base URL)
+
+    mode is a WEB_MODE; by default sync for one thread, else gthread.
+    """
+    port = free_port()
+    env = dict(
+        os.environ, DATABASE_URL=database_url, AUTO_MIGRATE='0',
+        OUTBOX_BACKEND='console', OUTBOX_AUTOSTART='0', RATELIMIT_ENABLED='0',
+        WEB_MODE=mode or ('gthread' if threads > 1 else 'sync'),
+        WEB_CONCURRENCY=str(workers), WEB_THREADS=str(threads), **(env or {})
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+         '-b', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn exited during startup')
+        try:
+            urllib.request.urlopen(base_url + '/health').read()
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn did not start within 30 seconds')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--animals', type=int, default=10000, help='animals in total, 1k to 1M')
+    parser.add_argument('--users', type=int, default=10, help='users sharing the animals')
+    parser.add_argument('--injections', type=int, default=3, help='injections per animal')
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per thread first')
+    parser.add_argument('--concurrency', type=int, default=4, help='client threads')
+    parser.add_argument('--endpoints', nargs='+', help='default: all')
+    parser.add_argument('--target', choices=('client', 'gunicorn', 'both'), default='client')
+    parser.add_argument('--gunicorn-workers', type=int, default=4)
+    parser.add_argument('--gunicorn-threads', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42, help='random seed for the synthetic data')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    app = make_app(args.database_url, OUTBOX_BACKEND='console', OUTBOX_AUTOSTART='0', RATELIMIT_ENABLED='0')
+    database_url = os.environ['DATABASE_URL']
+    per_user = max(1, args.animals // args.users)
+    user_ids = seed(app, users=args.users, animals_per_user=per_user,
+                    injections_per_animal=args.injections, seed_value=args.seed)
+
+    from sqlalchemy import func, select
+    from models import db, Animal
+    with app.app_context():
+        first_animals = dict(db.session.execute(
+            select(Animal.user_id, func.min(Animal.id)).where(Animal.user_id.in_(user_ids)).group_by(Animal.user_id)
+        ).all())
+    users = [{'email': f'bench{user_id}@example.com', 'animal_id': first_animals[user_id]} for user_id in user_ids]
+    random.Random(args.seed).shuffle(users)
+
+    names = args.endpoints or list(endpoints(None))
+    photo = make_photo() if 'photo_upload' in names else None
+
+    results = {
+        'started_at': datetime.utcnow().isoformat(),
+        'animals': per_user * args.users,
+        'users': args.users,
+        'injections_per_animal': args.injections,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'database': database_url.split(':', 1)[0],
+        'targets': {}
+    }
+    if args.target in ('client', 'both'):
+        results['targets']['client'] = run_target(lambda user: ClientSession(app, user), users, names, photo, args)
+    if args.target in ('gunicorn', 'both'):
+        process, base_url = start_gunicorn(database_url, args.gunicorn_workers, args.gunicorn_threads)
+        try:
+            results['targets']['gunicorn'] = run_target(lambda user: HTTPSession(base_url, user), users, names, photo, args)
+        finally:
+            process.terminate()
+            process.wait()
+        results['gunicorn'] = {'workers': args.gunicorn_workers, 'threads': args.gunicorn_threads}
+
+    write_results(args.output, results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
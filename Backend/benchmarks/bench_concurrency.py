@@ -0,0 +1,134 @@
+"""How many slow requests each gunicorn worker mode can hold at once
+
+For every WEB_MODE in --modes a local gunicorn is started, then for each
+--levels count that many clients long-poll the photo status of a pending
+photo (--hold seconds each, the request just waits) while one probe client
+keeps listing animals. A mode that runs out of room shows it twice: the
+long polls queue behind each other, so their wall time grows past --hold,
+and the probe's latency jumps because it waits for a free worker.
+
+gevent is only run against PostgreSQL (--database-url), see gunicorn.conf.py.
+
+    python -m benchmarks.bench_concurrency --modes sync gthread --levels 4 16 64 --output concurrency.json
+    python -m benchmarks.compare before.json concurrency.json
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from benchmarks.bench_api import HTTPSession, start_gunicorn
+from benchmarks.common import latency_stats, make_app, seed, write_results
+
+
+def hold(session, path, count):
+    """Send count long polls at once, returns (wall seconds, statuses)"""
+    statuses = []
+    lock = threading.Lock()
+
+    def worker():
+        status = session('GET', path, None, {})
+        with lock:
+            statuses.append(status)
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, statuses
+
+
+def run_level(session, pending_id, count, hold_seconds):
+    """Long polls plus the probe running alongside them"""
+    done = threading.Event()
+    probe_latencies, probe_errors = [], 0
+
+    def probe():
+        nonlocal probe_errors
+        while not done.is_set():
+            started = time.perf_counter()
+            status = session('GET', '/api/animals?limit=20', None, {})
+            probe_latencies.append((time.perf_counter() - started) * 1000)
+            if status >= 400:
+                probe_errors += 1
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+    elapsed, statuses = hold(session, f'/api/animals/{pending_id}/photo/status?wait={hold_seconds}', count)
+    done.set()
+    prober.join()
+
+    return dict(
+        long_polls=count,
+        long_poll_errors=sum(1 for status in statuses if status >= 400),
+        long_poll_wall_ms=round(elapsed * 1000, 1),
+        long_poll_rps=round(count / elapsed, 1),
+        probe_requests=len(probe_latencies),
+        probe_errors=probe_errors,
+        probe=latency_stats(probe_latencies)
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=['sync', 'gthread'], choices=('sync', 'gthread', 'gevent'))
+    parser.add_argument('--levels', nargs='+', type=int, default=[4, 16, 64], help='long polls at once')
+    parser.add_argument('--hold', type=float, default=2, help='seconds each long poll waits')
+    parser.add_argument('--workers', type=int, default=4, help='WEB_CONCURRENCY for every mode')
+    parser.add_argument('--threads', type=int, default=8, help='WEB_THREADS for gthread')
+    parser.add_argument('--connections', type=int, default=100, help='WEB_CONNECTIONS for gevent')
+    parser.add_argument('--animals', type=int, default=1000)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+    if not 0 < args.hold <= 10:
+        parser.error('--hold must be within PHOTO_STATUS_MAX_WAIT, 10 seconds')
+
+    app = make_app(args.database_url, OUTBOX_BACKEND='console', OUTBOX_AUTOSTART='0', RATELIMIT_ENABLED='0')
+    database_url = os.environ['DATABASE_URL']
+    user_id, = seed(app, users=1, animals_per_user=args.animals, injections_per_animal=1)
+
+    # An animal whose photo never finishes, so each status request waits --hold
+    from sqlalchemy import func, select, update
+    from models import db, Animal
+    with app.app_context():
+        pending_id = db.session.scalar(select(func.min(Animal.id)).where(Animal.user_id == user_id))
+        db.session.execute(update(Animal).where(Animal.id == pending_id).values(photo_status='pending'))
+        db.session.commit()
+
+    results = {
+        'started_at': datetime.utcnow().isoformat(),
+        'hold_seconds': args.hold,
+        'workers': args.workers,
+        'threads': args.threads,
+        'connections': args.connections,
+        'database': database_url.split(':', 1)[0],
+        'modes': {}
+    }
+    for mode in args.modes:
+        if mode == 'gevent' and not database_url.startswith('postgres'):
+            print('Skipping gevent: it needs a PostgreSQL --database-url', file=sys.stderr)
+            continue
+        process, base_url = start_gunicorn(
+            database_url, args.workers, args.threads, mode,
+            {'WEB_CONNECTIONS': str(args.connections), 'WEB_TIMEOUT': str(int(args.hold * 4) + 30)}
+        )
+        try:
+            session = HTTPSession(base_url, {'email': f'bench{user_id}@example.com'})
+            results['modes'][mode] = {
+                str(count): run_level(session, pending_id, count, args.hold) for count in args.levels
+            }
+        finally:
+            process.terminate()
+            process.wait()
+
+    write_results(args.output, results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""Streaming herd export and bulk import timings
+
+A user with --rows animals is seeded, their herd is exported as NDJSON and
+CSV through the API and each export is imported into a fresh account. For
+comparison, --baseline-rows animals are also created one POST /api/animals
+at a time. With --memory the peak Python allocation of each step is traced
+as well, which shows whether memory stays flat as --rows grows (tracing
+slows the run down).
+
+    python -m benchmarks.bench_export_import --rows 100000 --output transfer.json
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.common import make_app, seed, write_results
+
+
+def login(app, user_id):
+    client = app.test_client()
+    response = client.post('/api/login', json={'email': f'bench{user_id}@example.com', 'password': 'benchmark'})
+    assert response.status_code == 200, response.get_json()
+    return client
+
+
+def measure(fn, trace_memory):
+    """Run fn once, returns (its result, stats)"""
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        value = fn()
+    finally:
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+    stats = {'seconds': round(elapsed, 3)}
+    if peak is not None:
+        stats['peak_alloc_mb'] = round(peak / 1024 / 1024, 2)
+    return value, stats
+
+
+def export_to_file(client, fmt, path):
+    response = client.get(f'/api/animals/export?format={fmt}', buffered=False)
+    assert response.status_code == 200, response.status_code
+    size = 0
+    with open(path, 'wb') as f:
+        for chunk in response.iter_encoded():
+            f.write(chunk)
+            size += len(chunk)
+    response.close()
+    return size
+
+
+def import_file(client, fmt, path):
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    with open(path, 'rb') as f:
+        response = client.post('/api/animals/import', input_stream=f,
+                               content_length=os.path.getsize(path), content_type=mimetype)
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['imported']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help='animals in the exported herd')
+    parser.add_argument('--injections', type=int, default=3, help='injections per animal')
+    parser.add_argument('--baseline-rows', type=int, default=1000, help='animals created one request at a time')
+    parser.add_argument('--memory', action='store_true', help='trace peak allocations')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    app = make_app(args.database_url)
+    source = seed(app, users=1, animals_per_user=args.rows, injections_per_animal=args.injections)[0]
+    client = login(app, source)
+    folder = tempfile.mkdtemp(prefix='naam_transfer_')
+
+    results = {
+        'started_at': datetime.utcnow().isoformat(),
+        'rows': args.rows,
+        'injections_per_animal': args.injections,
+        'formats': {}
+    }
+    for fmt in ('ndjson', 'csv'):
+        path = os.path.join(folder, f'herd.{fmt}')
+        size, export_stats = measure(lambda: export_to_file(client, fmt, path), args.memory)
+        export_stats.update(bytes=size, rows_per_second=round(args.rows / export_stats['seconds']))
+
+        target = seed(app, users=1, animals_per_user=0)[0]
+        imported, import_stats = measure(lambda: import_file(login(app, target), fmt, path), args.memory)
+        assert imported == args.rows, imported
+        import_stats['rows_per_second'] = round(imported / import_stats['seconds'])
+
+        results['formats'][fmt] = {'export': export_stats, 'import': import_stats}
+        os.remove(path)
+
+    if args.baseline_rows:
+        target = login(app, seed(app, users=1, animals_per_user=0)[0])
+        animal = {
+            'name': 'Baseline', 'type': 'Cow', 'inseminatedDate': '2024-01-01',
+            'injections': [{'date': '2024-02-01', 'details': 'FMD vaccine'}] * args.injections
+        }
+
+        def one_at_a_time():
+            for _ in range(args.baseline_rows):
+                assert target.post('/api/animals', json=animal).status_code == 201
+
+        _, baseline = measure(one_at_a_time, False)
+        baseline['rows'] = args.baseline_rows
+        baseline['rows_per_second'] = round(args.baseline_rows / baseline['seconds'])
+        results['per_request_create'] = baseline
+
+    write_results(args.output, results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
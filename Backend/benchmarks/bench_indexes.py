@@ -0,0 +1,129 @@
+"""Query plans and timings for the per-user access patterns
+
+For each herd size a new user with that many animals is added, then the
+hot queries are EXPLAINed and timed for that user. With --check the run
+fails when a query falls back to a full table scan or a temporary sort,
+which is how a dropped or unusable index shows up. PostgreSQL rightly
+prefers sequential scans on small tables, so check it with herds of 10k+.
+
+    python -m benchmarks.bench_indexes --sizes 1000 10000 100000 --output indexes.json
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+from benchmarks.common import make_app, seed, timed, write_results
+
+
+# Tables that grow with herd size; small ones are fine to scan
+GROWING_TABLES = ('animals', 'injections')
+
+
+def hot_queries(user_id, email, page_ids):
+    from sqlalchemy import select, tuple_
+    from models import User, Animal, Injection, AnimalTombstone
+
+    page = select(Animal).where(Animal.user_id == user_id)
+    newest_first = (Animal.created_at.desc(), Animal.id.desc())
+    cursor_at = datetime.utcnow() - timedelta(days=180)
+    # A sync token's data_version, as /animals/changes gets it
+    since = 1
+    return {
+        'list_first_page': page.order_by(*newest_first).limit(51),
+        'list_cursor_page': page.where(
+            tuple_(Animal.created_at, Animal.id) < tuple_(cursor_at, 10 ** 9)
+        ).order_by(*newest_first).limit(51),
+        'animal_by_id': page.where(Animal.id == 1),
+        'changes_since': page.where(Animal.change_version > since).order_by(Animal.change_version, Animal.id),
+        'tombstones_since': select(AnimalTombstone.animal_id).where(
+            AnimalTombstone.user_id == user_id, AnimalTombstone.change_version > since
+        ),
+        'injections_for_page': select(Injection).where(Injection.animal_id.in_(page_ids)),
+        'login_lookup': select(User).where(User.email == email)
+    }
+
+
+def explain(conn, statement):
+    """Return the database's query plan for a statement as lines of text"""
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    if conn.dialect.name == 'sqlite':
+        rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params).fetchall()
+        return [row[-1] for row in rows]
+    rows = conn.exec_driver_sql('EXPLAIN ' + str(compiled), params).fetchall()
+    return [row[0] for row in rows]
+
+
+def plan_problems(dialect, plan):
+    """Full scans of growing tables and SQLite temporary sorts found in a plan"""
+    problems = []
+    for line in plan:
+        line = line.strip()
+        if dialect == 'sqlite':
+            scanned = line.startswith('SCAN ') and 'USING' not in line
+            if scanned and line.split()[1] in GROWING_TABLES:
+                problems.append(line)
+            elif 'USE TEMP B-TREE FOR ORDER BY' in line:
+                problems.append(line)
+        elif any(f'Seq Scan on {table} ' in line + ' ' for table in GROWING_TABLES):
+            problems.append(line)
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--injections', type=int, default=3, help='injections per animal')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    parser.add_argument('--check', action='store_true', help='exit 1 when a plan scans a whole table')
+    args = parser.parse_args(argv)
+
+    app = make_app(args.database_url)
+    from sqlalchemy import select
+    from models import db, User, Animal
+
+    results = {'dialect': None, 'started_at': datetime.utcnow().isoformat(), 'sizes': []}
+    failures = []
+    for size in args.sizes:
+        user_id = seed(app, users=1, animals_per_user=size, injections_per_animal=args.injections)[0]
+        with app.app_context():
+            email = db.session.get(User, user_id).email
+            page_ids = [row.id for row in db.session.execute(
+                select(Animal.id).where(Animal.user_id == user_id)
+                .order_by(Animal.created_at.desc(), Animal.id.desc()).limit(50)
+            )]
+            conn = db.session.connection()
+            dialect = conn.dialect.name
+            results['dialect'] = dialect
+            # Fresh statistics so the planner sees the real table sizes
+            conn.exec_driver_sql('ANALYZE')
+
+            queries = {}
+            for name, statement in hot_queries(user_id, email, page_ids).items():
+                plan = explain(conn, statement)
+                problems = plan_problems(dialect, plan)
+                queries[name] = {
+                    'plan': plan,
+                    'problems': problems,
+                    'timing': timed(lambda: db.session.execute(statement).fetchall(), args.repeat)
+                }
+                if problems:
+                    failures.append(f'{size} animals, {name}: {"; ".join(problems)}')
+            results['sizes'].append({'herd_size': size, 'queries': queries})
+
+    write_results(args.output, results)
+    if failures:
+        print('Plans without a usable index:', file=sys.stderr)
+        for failure in failures:
+            print('  ' + failure, file=sys.stderr)
+        if args.check:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
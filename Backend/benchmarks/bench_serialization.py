@@ -0,0 +1,83 @@
+"""Animal list serialization, ORM to_dict() against the Core serializer
+
+A user with --rows animals is seeded and their whole herd is turned into a
+JSON body three ways: ORM instances with to_dict() and the stdlib encoder
+(the old path), Core rows with the stdlib encoder, and Core rows with the
+app's JSON provider (orjson when installed). Query time is included, since
+skipping ORM hydration is part of the saving.
+
+    python -m benchmarks.bench_serialization --rows 10000 --output serialization.json
+"""
+import argparse
+import json
+import sys
+from datetime import datetime
+
+from benchmarks.common import make_app, seed, timed, write_results
+
+
+def normalized(body):
+    """Parsed body with injections sorted, the relationship has no order"""
+    document = json.loads(body)
+    for animal in document['animals']:
+        animal['injections'].sort(key=lambda injection: injection['id'])
+    return document
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000, help='animals in the serialized herd')
+    parser.add_argument('--injections', type=int, default=3, help='injections per animal')
+    parser.add_argument('--repeat', type=int, default=10, help='runs per path')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    app = make_app(args.database_url)
+    user_id = seed(app, users=1, animals_per_user=args.rows, injections_per_animal=args.injections)[0]
+
+    from sqlalchemy.orm import selectinload
+    import serializers
+    from models import db, Animal
+
+    def orm_stdlib():
+        animals = Animal.query.filter_by(user_id=user_id).options(selectinload(Animal.injections)).all()
+        body = json.dumps({'animals': [animal.to_dict() for animal in animals]})
+        db.session.expunge_all()
+        return body
+
+    def core_rows():
+        statement = serializers.animal_select().where(Animal.user_id == user_id)
+        return serializers.fetch_animals(statement, include_injections=True)
+
+    def core_stdlib():
+        return json.dumps({'animals': core_rows()}, default=serializers._default)
+
+    def core_provider():
+        return app.json.dumps({'animals': core_rows()})
+
+    results = {
+        'started_at': datetime.utcnow().isoformat(),
+        'rows': args.rows,
+        'injections_per_animal': args.injections,
+        'orjson': serializers.orjson is not None,
+        'paths': {}
+    }
+    with app.app_context():
+        # Both paths must produce the same document
+        assert normalized(orm_stdlib()) == normalized(core_provider())
+        for name, fn in (('orm_to_dict_stdlib', orm_stdlib),
+                         ('core_stdlib', core_stdlib),
+                         ('core_provider', core_provider)):
+            results['paths'][name] = timed(fn, args.repeat)
+
+    baseline = results['paths']['orm_to_dict_stdlib']['median_ms']
+    for stats in results['paths'].values():
+        stats['speedup'] = round(baseline / stats['median_ms'], 2)
+
+    write_results(args.output, results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Cold start: app import time and first-request latency
+
+Each run starts a fresh interpreter, imports the app and sends a few
+requests through the test client, the way a new gunicorn worker or a
+serverless cold start would. The first request includes the schema check.
+Heavy optional modules that got imported along the way are listed, so a
+new eager import of Pillow, flask_mail or twilio shows up.
+
+    python -m benchmarks.bench_startup --runs 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+from benchmarks.common import BACKEND_DIR, write_results
+
+
+# Modules that only the code paths needing them should load
+LAZY_MODULES = ('PIL', 'flask_mail', 'twilio', 'redis')
+
+# Runs in the child interpreter; prints one JSON line
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+client = app.test_client()
+timings = {'import_ms': (imported - started) * 1000}
+for name, path in (('first_request_ms', '/health'), ('second_request_ms', '/health'), ('first_api_ms', '/api/current-user')):
+    request_started = time.perf_counter()
+    client.get(path)
+    timings[name] = (time.perf_counter() - request_started) * 1000
+timings['eager_modules'] = sorted(
+    name for name in %r if name in sys.modules and name not in loaded_before
+)
+print(json.dumps(timings))
+'''
+
+
+def run_once(database_url):
+    env = dict(os.environ, DATABASE_URL=database_url, OUTBOX_AUTOSTART='0', OUTBOX_BACKEND='console')
+    code = 'import sys\nloaded_before = set(sys.modules)\n' + PROBE % (LAZY_MODULES,)
+    output = subprocess.run(
+        [sys.executable, '-c', code], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'min_ms': round(samples[0], 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'max_ms': round(samples[-1], 3)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters to start')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='naam_bench_'), 'bench.db')
+
+    # The first run creates the schema; later ones only find it up to date
+    run_once(database_url)
+    runs = [run_once(database_url) for _ in range(args.runs)]
+
+    results = {
+        'started_at': datetime.utcnow().isoformat(),
+        'runs': args.runs,
+        'python': sys.version.split()[0],
+        'eager_modules': sorted({name for run in runs for name in run['eager_modules']})
+    }
+    for key in ('import_ms', 'first_request_ms', 'second_request_ms', 'first_api_ms'):
+        results[key] = summarize([run[key] for run in runs])
+
+    write_results(args.output, results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ANIMAL_TYPES = ['Cow', 'Buffalo', 'Goat', 'Sheep']
+VACCINES = ['FMD vaccine', 'HS vaccine', 'BQ vaccine', 'Brucellosis vaccine', 'Deworming']
+
+
+def make_app(database_url=None, **env):
+    """Import the app against a benchmark database
+
+    Without database_url a fresh SQLite file in a temp folder is used. Must
+    be called before anything else imports the app modules.
+    """
+    if database_url is None:
+        folder = tempfile.mkdtemp(prefix='naam_bench_')
+        database_url = 'sqlite:///' + os.path.join(folder, 'bench.db')
+        os.environ.setdefault('UPLOAD_FOLDER', os.path.join(folder, 'uploads'))
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('OUTBOX_AUTOSTART', '0')
+    os.environ.setdefault('OUTBOX_BACKEND', 'console')
+    os.environ.update(env)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    from app import app
+    from database import prepare_database
+    prepare_database(app)
+    return app
+
+
+def seed(app, users=1, animals_per_user=1000, injections_per_animal=3, batch_size=5000, seed_value=42):
+    """Bulk insert synthetic users, animals and injections
+
+    Returns the ids of the created users.
+    """
+    from sqlalchemy import insert
+    from werkzeug.security import generate_password_hash
+    from models import db, User, Animal, Injection
+
+    rng = random.Random(seed_value)
+    password_hash = generate_password_hash('benchmark')
+    start = datetime.utcnow() - timedelta(days=365)
+
+    with app.app_context():
+        first_user = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+        user_ids = list(range(first_user, first_user + users))
+        db.session.execute(insert(User), [{
+            'id': user_id,
+            'email': f'bench{user_id}@example.com',
+            'name': f'Farmer {user_id}',
+            'password_hash': password_hash,
+            'is_verified': True,
+            'created_at': start
+        } for user_id in user_ids])
+
+        next_animal = (db.session.query(db.func.max(Animal.id)).scalar() or 0) + 1
+        animals, injections = [], []
+        for user_id in user_ids:
+            for n in range(animals_per_user):
+                created = start + timedelta(minutes=rng.randrange(525600))
+                inseminated = (created + timedelta(days=rng.randrange(60))).date() if rng.random() < 0.4 else None
+                animals.append({
+                    'id': next_animal,
+                    'user_id': user_id,
+                    'name': f'Animal {n}',
+                    'animal_type': rng.choice(ANIMAL_TYPES),
+                    'inseminated_date': inseminated,
+                    'notes': rng.choice(['', 'healthy', 'limping on left hind leg', 'mastitis treated']),
+                    'created_at': created,
+                    'updated_at': created + timedelta(days=rng.randrange(30))
+                })
+                for _ in range(injections_per_animal):
+                    injections.append({
+                        'animal_id': next_animal,
+                        'date': (created + timedelta(days=rng.randrange(365))).date(),
+                        'details': rng.choice(VACCINES),
+                        'created_at': created
+                    })
+                next_animal += 1
+                if len(animals) >= batch_size:
+                    _flush(db, Animal, Injection, animals, injections)
+        _flush(db, Animal, Injection, animals, injections)
+        db.session.commit()
+    return user_ids
+
+
+def _flush(db, Animal, Injection, animals, injections):
+    from sqlalchemy import insert
+    if animals:
+        db.session.execute(insert(Animal), animals)
+    if injections:
+        db.session.execute(insert(Injection), injections)
+    animals.clear()
+    injections.clear()
+
+
+def timed(fn, repeat=20):
+    """Run fn repeatedly and return latency statistics in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return dict(runs=repeat, **latency_stats(samples))
+
+
+def latency_stats(samples):
+    """min, median, p95, p99 and max of latencies in milliseconds"""
+    samples = sorted(samples)
+
+    def percentile(fraction):
+        return round(samples[min(len(samples) - 1, int(len(samples) * fraction))], 3)
+
+    return {
+        'min_ms': round(samples[0], 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(samples[-1], 3)
+    }
+
+
+def write_results(path, results):
+    """Write benchmark results as JSON, or print them when path is None"""
+    text = json.dumps(results, indent=2, default=str)
+    if path:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
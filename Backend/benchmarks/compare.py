@@ -0,0 +1,73 @@
+"""Compare two benchmark result files
+
+Every latency (*_ms) and throughput (*_rps) figure found in both files is
+listed with its relative change. Entries of result lists are matched by
+their herd_size (or name), otherwise by position. Latency going up or
+throughput going down by more than --threshold percent is flagged as a
+regression, and with --fail the exit status is 1 when there is one.
+
+    python -m benchmarks.compare before.json after.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+# Fields that name an entry of a result list, e.g. bench_indexes' sizes
+LIST_KEYS = ('herd_size', 'name')
+
+
+def list_key(index, item):
+    """Stable path part for a list entry, its index when it has no name"""
+    for key in LIST_KEYS:
+        if key in item:
+            return f'{key}={item[key]}'
+    return str(index)
+
+
+def figures(results, prefix=''):
+    """Flatten nested results to {'a.b.p95_ms': value} for *_ms and *_rps keys"""
+    found = {}
+    for key, value in results.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            found.update(figures(value, path + '.'))
+        elif isinstance(value, list):
+            for index, item in enumerate(value):
+                if isinstance(item, dict):
+                    found.update(figures(item, f'{path}.{list_key(index, item)}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key.endswith(('_ms', '_rps')):
+            found[path] = value
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10, help='percent change counted as a regression')
+    parser.add_argument('--fail', action='store_true', help='exit with status 1 on a regression')
+    args = parser.parse_args(argv)
+
+    with open(args.before) as f:
+        before = figures(json.load(f))
+    with open(args.after) as f:
+        after = figures(json.load(f))
+
+    regressions = 0
+    width = max((len(path) for path in before if path in after), default=0)
+    for path in sorted(path for path in before if path in after):
+        old, new = before[path], after[path]
+        change = (new - old) / old * 100 if old else 0.0
+        worse = change if path.endswith('_ms') else -change
+        flag = ''
+        if worse > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f'{path:<{width}}  {old:>12.3f}  {new:>12.3f}  {change:>+8.1f}%{flag}')
+
+    print(f'{regressions} regression(s) over {args.threshold:g}%')
+    return 1 if regressions and args.fail else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from models import db, User, Animal, AnimalTombstone
+from serializers import dumps
+
+try:
+    import redis
+except ImportError:  # optional, only needed for CACHE_REDIS_URL
+    redis = None
+
+# Animal listing pages are cached per user under users.data_version. Every
+# flush that adds, removes or changes an animal bumps the owner's version
+# in the same transaction, so a cached page is never served after a write
+# and pages of older versions simply age out. Core inserts that bypass the
+# ORM call bump_versions. The version doubles as the listing's ETag.
+#
+# The new version is also stamped on the changed animals and tombstones
+# (change_version). Writers of one user queue on the users row, so versions
+# become visible in commit order and delta sync can ask for everything
+# above the version it last saw.
+_cache = None
+_cache_lock = threading.Lock()
+
+@event.listens_for(Session, 'before_flush')
+def _bump_changed_owners(session, flush_context, instances):
+    changed = []
+    user_ids = set()
+    for obj in session.new:
+        if isinstance(obj, (Animal, AnimalTombstone)):
+            changed.append(obj)
+    for obj in session.dirty:
+        if isinstance(obj, Animal) and session.is_modified(obj):
+            changed.append(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Animal):
+            user_ids.add(obj.user_id)
+    user_ids.update(obj.user_id for obj in changed)
+    user_ids.discard(None)
+    if not user_ids:
+        return
+    versions = bump_versions(session, user_ids)
+    for obj in changed:
+        if obj.user_id in versions:
+            obj.change_version = versions[obj.user_id]
+
+def bump_versions(session, user_ids):
+    """Invalidate the cached listings of these users, returns {user_id: new version}"""
+    users = User.__table__
+    user_ids = sorted(set(user_ids))
+    connection = session.connection()
+    connection.execute(
+        update(users).where(users.c.id.in_(user_ids)).values(data_version=users.c.data_version + 1)
+    )
+    return dict(connection.execute(select(users.c.id, users.c.data_version).where(users.c.id.in_(user_ids))).all())
+
+def data_version(user_id):
+    """The user's current data version"""
+    return db.session.scalar(select(User.data_version).where(User.id == user_id)) or 0
+
+
+class LocalCache:
+    """Thread-safe LRU of at most max_entries values, each kept ttl seconds"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class RedisCache:
+    """Values stored as JSON in Redis, shared by every worker"""
+
+    def __init__(self, url, ttl, prefix='naam:animals:'):
+        if redis is None:
+            raise RuntimeError('CACHE_REDIS_URL is set but the redis package is not installed')
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            value = self.client.get(self.prefix + _key_string(key))
+        except redis.RedisError as e:
+            print(f"Cache read failed: {e}")
+            return None
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        try:
+            self.client.set(self.prefix + _key_string(key), dumps(value), ex=self.ttl)
+        except redis.RedisError as e:
+            print(f"Cache write failed: {e}")
+
+
+class ListingCache:
+    """The local LRU in front of an optional shared cache"""
+
+    def __init__(self, local, shared=None):
+        self.local = local
+        self.shared = shared
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+
+def make_cache(app):
+    """Build the listing cache configured for the app, None when disabled"""
+    config = app.config
+    if not config['CACHE_ENABLED']:
+        return None
+    shared = None
+    if config['CACHE_REDIS_URL']:
+        shared = RedisCache(config['CACHE_REDIS_URL'], config['CACHE_TTL'])
+    return ListingCache(LocalCache(config['CACHE_MAX_ENTRIES'], config['CACHE_TTL']), shared)
+
+def get_cache():
+    """This process's listing cache, built on first use (None when disabled)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = make_cache(current_app) or False
+        return _cache or None
+
+def _key_string(key):
+    return ':'.join(str(part) for part in key)
@@ -0,0 +1,88 @@
+import gzip
+import zlib
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is offered without it
+    brotli = None
+
+# Text responses are compressed on the way out for clients that send
+# Accept-Encoding, which matters on 2G/3G links. Photos and other media are
+# already compressed and keep their bytes, Range and sendfile behaviour.
+
+def init_compression(app):
+    """Compress eligible responses of the app with brotli or gzip"""
+    app.after_request(compress_response)
+
+def compress_response(response):
+    config = current_app.config
+    if response.mimetype not in config['COMPRESS_MIMETYPES']:
+        return response
+    response.vary.add('Accept-Encoding')
+
+    if (request.method == 'HEAD' or response.status_code != 200
+            or 'Content-Encoding' in response.headers):
+        return response
+    length = response.content_length
+    if length is not None and length < config['COMPRESS_MIN_SIZE']:
+        return response
+    encoding = _negotiate()
+    if encoding is None:
+        return response
+
+    response.direct_passthrough = False
+    if response.is_streamed:
+        # Exports and files: compress chunk by chunk, size is unknown upfront
+        chunks = response.iter_encoded()
+        source = response.response
+        response.response = _compress_stream(chunks, source, _compressor(encoding, config))
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(_compress(data, encoding, config))
+
+    response.content_encoding = encoding
+    # The encoded bytes are a different representation of the resource
+    response.headers.pop('Accept-Ranges', None)
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def _negotiate():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br'] and accepted['br'] >= accepted['gzip']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def _compress(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+def _compressor(encoding, config):
+    """(process, finish) for incremental compression"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=config['COMPRESS_BROTLI_QUALITY'])
+        return compressor.process, compressor.finish
+    # wbits 31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(config['COMPRESS_GZIP_LEVEL'], zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+def _compress_stream(chunks, source, compressor):
+    process, finish = compressor
+    try:
+        for chunk in chunks:
+            data = process(chunk)
+            if data:
+                yield data
+        yield finish()
+    finally:
+        close = getattr(source, 'close', None)
+        if close is not None:
+            close()
@@ -1,21 +1,165 @@
+import hashlib
 import os
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from flask_migrate import Migrate, upgrade
+from flask import g, has_request_context, request
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
 from models import db
+from search import SEARCH_TABLE, is_search_table
+
+MIGRATIONS_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'migrations')
+
+def _include_object(obj, name, type_, reflected, compare_to):
+    # The search index is built by raw SQL in its migration, not the models
+    return not (type_ == 'table' and is_search_table(name))
+
+migrate = Migrate(include_object=_include_object)
+_configured_engines = weakref.WeakSet()
+_thread_state = threading.local()
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 def init_database(app):
-    """Initialize database"""
+    """Initialize database (no I/O, see prepare_database)"""
+    migrate.init_app(app, db, directory=MIGRATIONS_DIR)
+    with app.app_context():
+        configure_engine(app)
+
+def prepare_database(app):
+    """Create the uploads folder and bring the schema up to date
+
+    Runs on the first request rather than at import, so gunicorn workers
+    and flask CLI commands boot without touching the database.
+    """
     with app.app_context():
         # Create uploads folder if it doesn't exist
-        upload_folder = app.config['UPLOAD_FOLDER']
-        if not os.path.exists(upload_folder):
-            os.makedirs(upload_folder)
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
         
-        # Create all tables
-        db.create_all()
+        # Bring the schema up to the latest migration
+        if app.config['AUTO_MIGRATE']:
+            with _migration_lock(app):
+                upgrade(directory=MIGRATIONS_DIR)
         print("Database initialized successfully!")
 
+@contextmanager
+def _migration_lock(app):
+    """Let one process on this host migrate at a time
+
+    gunicorn.conf.py migrates once before forking workers; this covers
+    other servers that start several processes. Without fcntl (Windows)
+    nothing is locked.
+    """
+    if fcntl is None:
+        yield
+        return
+    name = hashlib.sha1(app.config['SQLALCHEMY_DATABASE_URI'].encode()).hexdigest()[:16]
+    with open(os.path.join(tempfile.gettempdir(), f'naam-migrate-{name}.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def configure_engine(app):
+    """Apply SQLITE_* pragmas to each new SQLite connection
+
+    WAL lets readers carry on while a writer commits, and the busy timeout
+    makes concurrent writers wait for the lock instead of failing with
+    "database is locked".
+    """
+    engine = db.engine
+    if engine.dialect.name != 'sqlite' or engine in _configured_engines:
+        return
+    
+    config = app.config
+    pragmas = [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={config['SQLITE_BUSY_TIMEOUT_MS']}",
+        f"PRAGMA cache_size=-{config['SQLITE_CACHE_SIZE_KB']}",
+        f"PRAGMA mmap_size={config['SQLITE_MMAP_SIZE']}",
+        "PRAGMA temp_store=MEMORY"
+    ]
+    
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # Let SQLAlchemy issue BEGIN itself (below); pysqlite otherwise delays
+        # it until the first write, so a leading SAVEPOINT would open the
+        # transaction and its RELEASE would commit it
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+    
+    @event.listens_for(engine, 'begin')
+    def begin_transaction(connection):
+        connection.exec_driver_sql('BEGIN IMMEDIATE' if _expects_writes() else 'BEGIN')
+    
+    _configured_engines.add(engine)
+
+def _expects_writes():
+    """Whether a new SQLite transaction should take the write lock up front
+
+    A transaction that reads and then writes fails at once with "database
+    is locked" if another writer committed in between, busy timeout or not.
+    The first transaction of a request that changes data begins IMMEDIATE
+    instead and waits its turn. GET requests and reads that refresh objects
+    after a commit begin as before. Background threads begin IMMEDIATE only
+    inside write_with_retry.
+    """
+    if getattr(_thread_state, 'immediate', False):
+        return True
+    if not has_request_context() or request.method in ('GET', 'HEAD', 'OPTIONS'):
+        return False
+    if g.get('write_transaction_started'):
+        return False
+    g.write_transaction_started = True
+    return True
+
+@contextmanager
+def immediate_transactions():
+    """Begin this thread's SQLite transactions IMMEDIATE inside the block"""
+    previous = getattr(_thread_state, 'immediate', False)
+    _thread_state.immediate = True
+    try:
+        yield
+    finally:
+        _thread_state.immediate = previous
+
+def write_with_retry(write, attempts=5, delay=0.1):
+    """Run write() (which commits) in an IMMEDIATE transaction, returns its result
+
+    For background threads. A lock or connection error rolls the session
+    back and tries again with backoff; the last error is raised.
+    """
+    for attempt in range(attempts):
+        try:
+            with immediate_transactions():
+                return write()
+        except OperationalError as e:
+            db.session.rollback()
+            if attempt == attempts - 1:
+                raise
+            print(f"Retrying write after: {e.orig}")
+            time.sleep(delay * 2 ** attempt)
+
 def reset_database(app):
     """Reset database (use with caution!)"""
     with app.app_context():
         db.drop_all()
-        db.create_all()
+        with db.engine.begin() as conn:
+            conn.execute(text(f'DROP TABLE IF EXISTS {SEARCH_TABLE}'))
+            conn.execute(text('DROP TABLE IF EXISTS alembic_version'))
+        upgrade(directory=MIGRATIONS_DIR)
         print("Database reset successfully!")
\ No newline at end of file
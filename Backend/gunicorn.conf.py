@@ -0,0 +1,55 @@
+"""gunicorn settings, read from Backend (see Procfile)
+
+WEB_MODE picks how a worker process serves requests at once:
+
+    gthread  (default) WEB_THREADS threads per process. A request waiting
+             on a photo status long poll, a slow upload or a database lock
+             holds one thread instead of a whole process.
+    sync     one request per process.
+    gevent   up to WEB_CONNECTIONS requests per process on an event loop.
+             Needs gevent installed and PostgreSQL. sqlite3 sleeps out
+             its busy timeout inside C without yielding, so one request
+             waiting for the SQLite write lock stalls every other
+             request in that process.
+
+Email and SMS are sent by the outbox thread and photos are resized in the
+PHOTO_WORKERS process pool, so no mode waits on SMTP, Twilio or Pillow
+inside a request. python -m benchmarks.bench_concurrency compares them.
+
+With AUTO_MIGRATE on (the default) the master runs 'flask db upgrade' once
+before forking, and the workers skip it.
+"""
+import os
+import subprocess
+import sys
+
+mode = os.environ.get('WEB_MODE', 'gthread').lower()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+
+if mode == 'gthread':
+    worker_class = 'gthread'
+    threads = int(os.environ.get('WEB_THREADS', 8))
+elif mode == 'gevent':
+    database_url = os.environ.get('DATABASE_URL', '')
+    if not database_url.startswith(('postgres://', 'postgresql')):
+        raise RuntimeError('WEB_MODE=gevent needs DATABASE_URL to point at PostgreSQL')
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('WEB_CONNECTIONS', 100))
+elif mode == 'sync':
+    worker_class = 'sync'
+else:
+    raise RuntimeError(f"Unknown WEB_MODE {mode!r}, expected gthread, sync or gevent")
+
+
+def on_starting(server):
+    if os.environ.get('AUTO_MIGRATE', '1').lower() not in ('1', 'true', 'yes'):
+        return
+    # A separate process, so the master never imports the app
+    subprocess.run(
+        [sys.executable, '-m', 'flask', '--app', 'app', 'db', 'upgrade'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+    )
+    os.environ['AUTO_MIGRATE'] = '0'
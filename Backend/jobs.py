@@ -0,0 +1,226 @@
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from sqlalchemy import update
+from database import write_with_retry
+from metrics import observe_section
+from models import db, Animal, Photo
+from utils import process_image, delete_file, delete_photo
+
+# Photo processing runs in a bounded process pool so Pillow work never
+# holds a request worker. Everything here is per gunicorn worker process.
+# Finished jobs are written back by a finisher thread, not the pool's own
+# callback thread, so a wait on the database never delays other jobs'
+# results. The pool spawns its processes: forking a threaded worker can
+# copy held locks into the child.
+_executor = None
+_executor_lock = threading.Lock()
+_finished = queue.Queue()
+_finisher = None
+_slots = None
+_latest_jobs = {}
+_job_counter = 0
+
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=app.config['PHOTO_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _start_finisher()
+        return _executor
+
+def _start_finisher():
+    global _finisher
+    if _finisher is None or not _finisher.is_alive():
+        _finisher = threading.Thread(target=_run_finisher, name='photo-finisher', daemon=True)
+        _finisher.start()
+
+def _run_finisher():
+    """Write back finished jobs one at a time, until shutdown_jobs sends None"""
+    while True:
+        item = _finished.get()
+        if item is None:
+            return
+        finish, future = item
+        finish(_future_result(future))
+
+def _get_slots(app):
+    global _slots
+    with _executor_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(app.config['PHOTO_QUEUE_LIMIT'])
+        return _slots
+
+def reserve_photo_slot(app):
+    """Reserve room for one photo job, returns False when the queue is full"""
+    return _get_slots(app).acquire(blocking=False)
+
+def release_photo_slot(app):
+    """Give back a slot reserved by reserve_photo_slot"""
+    _get_slots(app).release()
+
+def submit_photo_job(app, animal_id, staged_path):
+    """Process a staged upload for an animal whose photo_status is committed as pending
+
+    A slot must already be reserved with reserve_photo_slot. With
+    PHOTO_WORKERS set to 0 the photo is processed inline instead.
+    """
+    global _job_counter
+    with _executor_lock:
+        _job_counter += 1
+        job_id = _job_counter
+        _latest_jobs[animal_id] = job_id
+
+    upload_folder = app.config['UPLOAD_FOLDER']
+    webp = app.config['PHOTO_WEBP']
+    finish = partial(_finish_photo_job, app, animal_id, job_id, staged_path, time.perf_counter())
+
+    if app.config['PHOTO_WORKERS'] <= 0:
+        try:
+            filename = process_image(staged_path, upload_folder, webp)
+        except Exception as e:
+            print(f"Error processing photo: {e}")
+            filename = None
+        finish(filename)
+        return
+
+    try:
+        future = _get_executor(app).submit(process_image, staged_path, upload_folder, webp)
+    except Exception as e:
+        print(f"Error submitting photo job: {e}")
+        finish(None)
+        return
+    future.add_done_callback(lambda done: _finished.put((finish, done)))
+
+def _future_result(future):
+    try:
+        return future.result()
+    except Exception as e:
+        print(f"Error processing photo: {e}")
+        return None
+
+def _finish_photo_job(app, animal_id, job_id, staged_path, submitted, filename):
+    """Attach a processed photo to its animal and clean up"""
+    # Queue wait plus Pillow work in the pool
+    observe_section('photo_processing', time.perf_counter() - submitted)
+    upload_folder = app.config['UPLOAD_FOLDER']
+    try:
+        with app.app_context():
+            with _executor_lock:
+                superseded = _latest_jobs.get(animal_id) != job_id
+                if not superseded:
+                    _latest_jobs.pop(animal_id, None)
+
+            try:
+                unused = write_with_retry(partial(_attach_photo, animal_id, filename, superseded))
+            except Exception as e:
+                print(f"Error finishing photo job: {e}")
+                unused = [filename] if filename else []
+                if not superseded:
+                    write_with_retry(partial(_fail_photo, animal_id))
+
+            for name in unused:
+                if db.session.get(Photo, name) is None:
+                    delete_photo(upload_folder, name)
+            db.session.rollback()
+    except Exception as e:
+        print(f"Error finishing photo job: {e}")
+    finally:
+        delete_file(staged_path)
+        release_photo_slot(app)
+
+def _attach_photo(animal_id, filename, superseded):
+    """Point the animal at its processed photo and commit
+
+    Returns photo files that may be unused now; the caller deletes those
+    without a photos row.
+    """
+    animal = db.session.get(Animal, animal_id)
+
+    # Animal deleted or a newer upload arrived while this one was processing
+    if animal is None or superseded:
+        db.session.rollback()
+        return [filename] if filename else []
+
+    unused = []
+    if filename:
+        if animal.photo_path != filename:
+            acquire_photo(filename)
+            if animal.photo_path and release_photo(animal.photo_path):
+                unused.append(animal.photo_path)
+            animal.photo_path = filename
+        animal.photo_status = 'ready'
+    else:
+        animal.photo_status = 'failed'
+    db.session.commit()
+    return unused
+
+def _fail_photo(animal_id):
+    animal = db.session.get(Animal, animal_id)
+    if animal is not None and animal.photo_status == 'pending':
+        animal.photo_status = 'failed'
+    db.session.commit()
+
+def sweep_stuck_photos(app, max_age=None):
+    """Mark photos pending for longer than PHOTO_PENDING_TIMEOUT as failed
+
+    Catches jobs lost with a crashed worker. Returns how many were marked.
+    """
+    max_age = max_age or app.config['PHOTO_PENDING_TIMEOUT']
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+
+    def sweep():
+        animals = Animal.query.filter(Animal.photo_status == 'pending', Animal.updated_at < cutoff).all()
+        for animal in animals:
+            animal.photo_status = 'failed'
+        db.session.commit()
+        return len(animals)
+
+    with app.app_context():
+        return write_with_retry(sweep)
+
+def acquire_photo(filename):
+    """Count one more animal using a stored photo"""
+    result = db.session.execute(
+        update(Photo).where(Photo.filename == filename).values(ref_count=Photo.ref_count + 1)
+    )
+    if not result.rowcount:
+        db.session.add(Photo(filename=filename, ref_count=1))
+
+def release_photo(filename):
+    """Count one less animal using a stored photo
+
+    Returns True when nothing uses the photo any more, in which case the
+    caller deletes its files after committing.
+    """
+    db.session.execute(
+        update(Photo).where(Photo.filename == filename).values(ref_count=Photo.ref_count - 1)
+    )
+    photo = db.session.get(Photo, filename, populate_existing=True)
+    if photo is None:
+        # Stored before reference counting, owned by a single animal
+        return True
+    if photo.ref_count <= 0:
+        db.session.delete(photo)
+        return True
+    return False
+
+def shutdown_jobs(wait=True):
+    """Stop the photo worker pool, then the finisher once it has written back every job"""
+    global _executor, _finisher
+    with _executor_lock:
+        executor, _executor = _executor, None
+        finisher, _finisher = _finisher, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+    if finisher is not None:
+        _finished.put(None)
+        if wait:
+            finisher.join()
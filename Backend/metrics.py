@@ -0,0 +1,210 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Request latency, SQL per request and timers around the slow sections
+# (photo staging and processing, outbox sends, JSON encoding), served in
+# the Prometheus text format on /metrics. Numbers are per process; with
+# several gunicorn workers each scrape sees the worker that answered.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Prometheus histogram with a fixed label set"""
+
+    def __init__(self, name, help, labelnames, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, (list(counts), count, total)) for labels, (counts, count, total) in self._series.items())
+        for labels, (counts, count, total) in series:
+            pairs = list(zip(self.labelnames, labels))
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_labels(pairs + [("le", _number(bound))])} {bucket_count}')
+            lines.append(f'{self.name}_bucket{_labels(pairs + [("le", "+Inf")])} {count}')
+            lines.append(f'{self.name}_count{_labels(pairs)} {count}')
+            lines.append(f'{self.name}_sum{_labels(pairs)} {_number(total)}')
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'naam_http_request_duration_seconds', 'Time to build a response',
+    ('method', 'route', 'status')
+)
+REQUEST_QUERIES = Histogram(
+    'naam_http_request_sql_queries', 'SQL statements run by one request',
+    ('method', 'route'), QUERY_BUCKETS
+)
+REQUEST_SQL_TIME = Histogram(
+    'naam_http_request_sql_duration_seconds', 'Time one request spent in SQL',
+    ('method', 'route')
+)
+SECTION_DURATION = Histogram(
+    'naam_section_duration_seconds', 'Time spent in instrumented sections',
+    ('section',)
+)
+METRICS = (REQUEST_DURATION, REQUEST_QUERIES, REQUEST_SQL_TIME, SECTION_DURATION)
+
+
+def observe_section(section, seconds):
+    SECTION_DURATION.observe((section,), seconds)
+
+@contextmanager
+def timer(section):
+    """Time the enclosed block as naam_section_duration_seconds{section}"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_section(section, time.perf_counter() - started)
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# The start time rides on the statement's execution context, so a
+# statement that raises (see handle_error) cannot unpair later ones
+@event.listens_for(Engine, 'before_cursor_execute')
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.naam_query_started = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    _count_query(context)
+
+@event.listens_for(Engine, 'handle_error')
+def _query_failed(exception_context):
+    _count_query(exception_context.execution_context)
+
+def _count_query(context):
+    started = getattr(context, 'naam_query_started', None)
+    if started is None:
+        return
+    del context.naam_query_started
+    elapsed = time.perf_counter() - started
+    if has_request_context() and 'naam_request_started' in g:
+        g.naam_queries += 1
+        g.naam_sql_time += elapsed
+
+
+def init_metrics(app):
+    """Record request metrics for the app and serve them on /metrics"""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_record_request)
+    app.add_url_rule('/metrics', 'metrics', _metrics_view)
+
+def _start_request():
+    g.naam_request_started = time.perf_counter()
+    g.naam_queries = 0
+    g.naam_sql_time = 0.0
+
+    rate = current_app.config['PROFILE_SAMPLE_RATE']
+    if rate and random.random() < rate:
+        g.naam_profiler = _start_profiler(current_app.config['PROFILE_ENGINE'])
+
+def _finish_request(response):
+    if 'naam_request_started' not in g:
+        return response
+    g.naam_status = response.status_code
+    total = time.perf_counter() - g.naam_request_started
+    response.headers['Server-Timing'] = (
+        f'db;dur={g.naam_sql_time * 1000:.1f};desc="{g.naam_queries} queries", '
+        f'app;dur={total * 1000:.1f}'
+    )
+    return response
+
+def _record_request(exc):
+    if 'naam_request_started' not in g:
+        return
+    elapsed = time.perf_counter() - g.naam_request_started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    status = str(g.get('naam_status', 500))
+    REQUEST_DURATION.observe((request.method, route, status), elapsed)
+    REQUEST_QUERIES.observe((request.method, route), g.naam_queries)
+    REQUEST_SQL_TIME.observe((request.method, route), g.naam_sql_time)
+
+    profiler = g.pop('naam_profiler', None)
+    if profiler is not None:
+        _save_profile(profiler, route)
+
+def _metrics_view():
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(render(), mimetype='text/plain', content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _start_profiler(engine):
+    """(engine, running profiler), or None if one is already running"""
+    try:
+        if engine == 'pyinstrument':
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+        else:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+    except (RuntimeError, ValueError) as e:
+        # Another request in this process is being profiled
+        print(f"Skipping profile: {e}")
+        return None
+    return engine, profiler
+
+def _save_profile(profiler, route):
+    """Write a sampled request's profile to PROFILE_DIR"""
+    engine, profiler = profiler
+    folder = current_app.config['PROFILE_DIR']
+    os.makedirs(folder, exist_ok=True)
+    name = route.strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'index'
+    path = os.path.join(folder, f'{time.time():.3f}-{os.getpid()}-{request.method}-{name}')
+    try:
+        if engine == 'pyinstrument':
+            profiler.stop()
+            with open(path + '.html', 'w') as f:
+                f.write(profiler.output_html())
+        else:
+            profiler.disable()
+            profiler.dump_stats(path + '.prof')
+    except Exception as e:
+        print(f"Error saving profile: {e}")
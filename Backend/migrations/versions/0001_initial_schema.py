@@ -0,0 +1,133 @@
+"""initial schema
+
+Databases created before migrations existed were built with create_all,
+so every table, column and index is only created when it is missing.
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-16 20:38:44.610146
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def _has_column(table, column):
+    return column in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def _has_index(table, name):
+    return name in {i['name'] for i in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    if not _has_table('users'):
+        op.create_table('users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('email', sa.String(length=120), nullable=True),
+        sa.Column('mobile', sa.String(length=15), nullable=True),
+        sa.Column('password_hash', sa.String(length=200), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('verification_code', sa.String(length=6), nullable=True),
+        sa.Column('is_verified', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+        sa.UniqueConstraint('mobile')
+        )
+
+    if not _has_table('animals'):
+        op.create_table('animals',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('animal_type', sa.String(length=50), nullable=False),
+        sa.Column('photo_path', sa.String(length=200), nullable=True),
+        sa.Column('photo_status', sa.String(length=20), nullable=True),
+        sa.Column('inseminated_date', sa.Date(), nullable=True),
+        sa.Column('delivery_date', sa.Date(), nullable=True),
+        sa.Column('calf_details', sa.Text(), nullable=True),
+        sa.Column('notes', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    elif not _has_column('animals', 'photo_status'):
+        with op.batch_alter_table('animals', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('photo_status', sa.String(length=20), nullable=True))
+
+    if not _has_index('animals', 'ix_animals_updated_at'):
+        with op.batch_alter_table('animals', schema=None) as batch_op:
+            batch_op.create_index('ix_animals_updated_at', ['updated_at'], unique=False)
+
+    if not _has_table('injections'):
+        op.create_table('injections',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('animal_id', sa.Integer(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('details', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['animal_id'], ['animals.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+    if not _has_table('animal_tombstones'):
+        op.create_table('animal_tombstones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('animal_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if not _has_index('animal_tombstones', 'ix_animal_tombstones_user_deleted'):
+        with op.batch_alter_table('animal_tombstones', schema=None) as batch_op:
+            batch_op.create_index('ix_animal_tombstones_user_deleted', ['user_id', 'deleted_at'], unique=False)
+
+    if not _has_table('photos'):
+        op.create_table('photos',
+        sa.Column('filename', sa.String(length=200), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('filename')
+        )
+
+    if not _has_table('outbox'):
+        op.create_table('outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('channel', sa.String(length=10), nullable=False),
+        sa.Column('recipient', sa.String(length=120), nullable=False),
+        sa.Column('subject', sa.String(length=200), nullable=True),
+        sa.Column('body', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=10), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if not _has_index('outbox', 'ix_outbox_status_next_attempt'):
+        with op.batch_alter_table('outbox', schema=None) as batch_op:
+            batch_op.create_index('ix_outbox_status_next_attempt', ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade():
+    op.drop_table('outbox')
+    op.drop_table('photos')
+    op.drop_table('animal_tombstones')
+    op.drop_table('injections')
+    op.drop_table('animals')
+    op.drop_table('users')
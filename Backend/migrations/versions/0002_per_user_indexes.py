@@ -0,0 +1,36 @@
+"""per-user composite indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-16 21:05:12.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('animals', schema=None) as batch_op:
+        batch_op.drop_index('ix_animals_updated_at')
+        batch_op.create_index('ix_animals_user_created', ['user_id', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_animals_user_updated', ['user_id', 'updated_at'], unique=False)
+
+    with op.batch_alter_table('injections', schema=None) as batch_op:
+        batch_op.create_index('ix_injections_animal_date', ['animal_id', 'date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('injections', schema=None) as batch_op:
+        batch_op.drop_index('ix_injections_animal_date')
+
+    with op.batch_alter_table('animals', schema=None) as batch_op:
+        batch_op.drop_index('ix_animals_user_updated')
+        batch_op.drop_index('ix_animals_user_created')
+        batch_op.create_index('ix_animals_updated_at', ['updated_at'], unique=False)
@@ -0,0 +1,167 @@
+"""full-text search index over animals and injections
+
+SQLite gets an FTS5 table, PostgreSQL a tsvector table with a GIN index.
+Triggers keep either one in sync with animals and injections.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-16 23:02:51.730264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_INJECTION_DETAILS = "(SELECT group_concat(details, ' ') FROM injections WHERE animal_id = {})"
+
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE animal_search USING fts5("
+    "user_id UNINDEXED, name, notes, calf_details, injections, tokenize='porter unicode61')",
+    """
+    CREATE TRIGGER animal_search_animals_insert AFTER INSERT ON animals BEGIN
+        INSERT INTO animal_search (rowid, user_id, name, notes, calf_details, injections)
+        VALUES (new.id, new.user_id, new.name, new.notes, new.calf_details, {});
+    END
+    """.format(SQLITE_INJECTION_DETAILS.format('new.id')),
+    """
+    CREATE TRIGGER animal_search_animals_update AFTER UPDATE OF user_id, name, notes, calf_details ON animals BEGIN
+        UPDATE animal_search
+        SET user_id = new.user_id, name = new.name, notes = new.notes, calf_details = new.calf_details
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER animal_search_animals_delete AFTER DELETE ON animals BEGIN
+        DELETE FROM animal_search WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER animal_search_injections_insert AFTER INSERT ON injections BEGIN
+        UPDATE animal_search SET injections = {} WHERE rowid = new.animal_id;
+    END
+    """.format(SQLITE_INJECTION_DETAILS.format('new.animal_id')),
+    """
+    CREATE TRIGGER animal_search_injections_update AFTER UPDATE OF details, animal_id ON injections BEGIN
+        UPDATE animal_search SET injections = {} WHERE rowid = new.animal_id;
+        UPDATE animal_search SET injections = {} WHERE rowid = old.animal_id AND old.animal_id != new.animal_id;
+    END
+    """.format(SQLITE_INJECTION_DETAILS.format('new.animal_id'), SQLITE_INJECTION_DETAILS.format('old.animal_id')),
+    """
+    CREATE TRIGGER animal_search_injections_delete AFTER DELETE ON injections BEGIN
+        UPDATE animal_search SET injections = {} WHERE rowid = old.animal_id;
+    END
+    """.format(SQLITE_INJECTION_DETAILS.format('old.animal_id')),
+    """
+    INSERT INTO animal_search (rowid, user_id, name, notes, calf_details, injections)
+    SELECT id, user_id, name, notes, calf_details, {} FROM animals
+    """.format(SQLITE_INJECTION_DETAILS.format('animals.id'))
+]
+
+SQLITE_DOWNGRADE = [
+    'DROP TRIGGER IF EXISTS animal_search_injections_delete',
+    'DROP TRIGGER IF EXISTS animal_search_injections_update',
+    'DROP TRIGGER IF EXISTS animal_search_injections_insert',
+    'DROP TRIGGER IF EXISTS animal_search_animals_delete',
+    'DROP TRIGGER IF EXISTS animal_search_animals_update',
+    'DROP TRIGGER IF EXISTS animal_search_animals_insert',
+    'DROP TABLE IF EXISTS animal_search'
+]
+
+POSTGRESQL_UPGRADE = [
+    """
+    CREATE TABLE animal_search (
+        animal_id integer PRIMARY KEY,
+        user_id integer NOT NULL,
+        document tsvector NOT NULL
+    )
+    """,
+    'CREATE INDEX ix_animal_search_document ON animal_search USING gin (document)',
+    # Name ranks above notes and calf details, which rank above injections
+    """
+    CREATE OR REPLACE FUNCTION animal_search_refresh(target integer) RETURNS void AS $$
+    BEGIN
+        INSERT INTO animal_search (animal_id, user_id, document)
+        SELECT a.id, a.user_id,
+            setweight(to_tsvector('english', coalesce(a.name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(a.notes, '') || ' ' || coalesce(a.calf_details, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(
+                (SELECT string_agg(i.details, ' ') FROM injections i WHERE i.animal_id = a.id), '')), 'C')
+        FROM animals a
+        WHERE a.id = target
+        ON CONFLICT (animal_id) DO UPDATE SET user_id = EXCLUDED.user_id, document = EXCLUDED.document;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION animal_search_animals_changed() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM animal_search WHERE animal_id = OLD.id;
+        ELSE
+            PERFORM animal_search_refresh(NEW.id);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION animal_search_injections_changed() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM animal_search_refresh(OLD.animal_id);
+        END IF;
+        IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.animal_id <> OLD.animal_id) THEN
+            PERFORM animal_search_refresh(NEW.animal_id);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER animal_search_animals
+    AFTER INSERT OR DELETE OR UPDATE OF user_id, name, notes, calf_details ON animals
+    FOR EACH ROW EXECUTE FUNCTION animal_search_animals_changed()
+    """,
+    """
+    CREATE TRIGGER animal_search_injections
+    AFTER INSERT OR DELETE OR UPDATE OF animal_id, details ON injections
+    FOR EACH ROW EXECUTE FUNCTION animal_search_injections_changed()
+    """,
+    'SELECT animal_search_refresh(id) FROM animals'
+]
+
+POSTGRESQL_DOWNGRADE = [
+    'DROP TRIGGER IF EXISTS animal_search_injections ON injections',
+    'DROP TRIGGER IF EXISTS animal_search_animals ON animals',
+    'DROP FUNCTION IF EXISTS animal_search_injections_changed()',
+    'DROP FUNCTION IF EXISTS animal_search_animals_changed()',
+    'DROP FUNCTION IF EXISTS animal_search_refresh(integer)',
+    'DROP TABLE IF EXISTS animal_search'
+]
+
+
+def _statements(upgrade):
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return SQLITE_UPGRADE if upgrade else SQLITE_DOWNGRADE
+    if dialect == 'postgresql':
+        return POSTGRESQL_UPGRADE if upgrade else POSTGRESQL_DOWNGRADE
+    # Other databases have no search index; /api/animals/search answers 501
+    return []
+
+
+def upgrade():
+    for statement in _statements(upgrade=True):
+        op.execute(statement)
+
+
+def downgrade():
+    for statement in _statements(upgrade=False):
+        op.execute(statement)
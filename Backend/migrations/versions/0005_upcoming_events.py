@@ -0,0 +1,137 @@
+"""upcoming delivery and booster events
+
+Existing animals' events are filled in by the upgrade, a chunk of
+animals at a time.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-16 23:48:09.164720
+
+"""
+import re
+from datetime import datetime, timedelta
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+BACKFILL_CHUNK = 500
+
+# The event rules as of this revision, frozen here so replaying the
+# migration never depends on how reminders.py computes events later
+GESTATION_DAYS = {'Cow': 283, 'Buffalo': 310, 'Goat': 150, 'Sheep': 147}
+BOOSTERS = [
+    ('FMD', re.compile(r'\bfmd\b|foot.and.mouth'), 180),
+    ('HS', re.compile(r'\bhs\b|ha?emorrhagic'), 365),
+    ('BQ', re.compile(r'\bbq\b|black.?quarter'), 365),
+    ('Deworming', re.compile(r'deworm'), 90)
+]
+
+
+def upgrade():
+    upcoming_events = op.create_table('upcoming_events',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('animal_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('label', sa.String(length=100), nullable=True),
+    sa.Column('injection_id', sa.Integer(), nullable=True),
+    sa.Column('due_date', sa.Date(), nullable=False),
+    sa.Column('notified_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('upcoming_events', schema=None) as batch_op:
+        batch_op.create_index('ix_upcoming_events_animal', ['animal_id'], unique=False)
+        batch_op.create_index('ix_upcoming_events_due_notified', ['due_date', 'notified_at'], unique=False)
+        batch_op.create_index('ix_upcoming_events_user_due', ['user_id', 'due_date'], unique=False)
+
+    _backfill(upcoming_events)
+
+
+def _backfill(upcoming_events):
+    """Events for the animals already in the database"""
+    animals = sa.table('animals',
+        sa.column('id', sa.Integer), sa.column('user_id', sa.Integer), sa.column('animal_type', sa.String),
+        sa.column('inseminated_date', sa.Date), sa.column('delivery_date', sa.Date))
+    injections = sa.table('injections',
+        sa.column('id', sa.Integer), sa.column('animal_id', sa.Integer),
+        sa.column('date', sa.Date), sa.column('details', sa.Text))
+
+    bind = op.get_bind()
+    now = datetime.utcnow()
+    last_id = 0
+    while True:
+        chunk = bind.execute(
+            sa.select(animals).where(animals.c.id > last_id).order_by(animals.c.id).limit(BACKFILL_CHUNK)
+        ).all()
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+
+        by_animal = {}
+        for injection in bind.execute(
+            sa.select(injections)
+            .where(injections.c.animal_id.in_([animal.id for animal in chunk]))
+            .order_by(injections.c.date, injections.c.id)
+        ):
+            by_animal.setdefault(injection.animal_id, []).append(injection)
+
+        rows = [
+            dict(row, created_at=now)
+            for animal in chunk
+            for row in _animal_events(animal, by_animal.get(animal.id, []))
+        ]
+        if rows:
+            op.bulk_insert(upcoming_events, rows)
+
+
+def _animal_events(animal, injections):
+    """Event rows for one animal, injections ordered by date"""
+    events = []
+
+    def add(kind, due_date, label=None, injection_id=None):
+        events.append({
+            'user_id': animal.user_id,
+            'animal_id': animal.id,
+            'kind': kind,
+            'label': label,
+            'injection_id': injection_id,
+            'due_date': due_date
+        })
+
+    # Pregnant: inseminated, and no delivery recorded since
+    gestation = GESTATION_DAYS.get(animal.animal_type)
+    inseminated, delivered = animal.inseminated_date, animal.delivery_date
+    if gestation and inseminated and not (delivered and delivered >= inseminated):
+        add('expected_delivery', inseminated + timedelta(days=gestation))
+    if delivered:
+        add('delivery', delivered)
+
+    # Only the latest dose of each vaccine schedules a booster
+    latest = {}
+    for injection in injections:
+        details = injection.details.lower()
+        for label, pattern, days in BOOSTERS:
+            if pattern.search(details):
+                latest[label] = (injection, days)
+    for label, (injection, days) in latest.items():
+        add('booster', injection.date + timedelta(days=days), label, injection.id)
+
+    return events
+
+
+def downgrade():
+    with op.batch_alter_table('upcoming_events', schema=None) as batch_op:
+        batch_op.drop_index('ix_upcoming_events_user_due')
+        batch_op.drop_index('ix_upcoming_events_due_notified')
+        batch_op.drop_index('ix_upcoming_events_animal')
+
+    op.drop_table('upcoming_events')
@@ -0,0 +1,41 @@
+"""per-user herd counters
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 00:31:22.847115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('herd_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('animal_type', sa.String(length=50), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('pregnant', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'animal_type')
+    )
+    # Counts for the animals that already exist
+    op.execute("""
+        INSERT INTO herd_stats (user_id, animal_type, total, pregnant)
+        SELECT user_id, animal_type, count(*),
+            sum(CASE WHEN inseminated_date IS NOT NULL
+                      AND (delivery_date IS NULL OR delivery_date < inseminated_date)
+                THEN 1 ELSE 0 END)
+        FROM animals
+        GROUP BY user_id, animal_type
+    """)
+
+
+def downgrade():
+    op.drop_table('herd_stats')
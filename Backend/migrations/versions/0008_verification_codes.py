@@ -0,0 +1,55 @@
+"""expiring verification codes outside the users table
+
+Pending codes are carried over with a fresh 10 minute expiry.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 03:26:51.804117
+
+"""
+from datetime import datetime, timedelta
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    verification_codes = op.create_table('verification_codes',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('code', sa.String(length=6), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    with op.batch_alter_table('verification_codes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_verification_codes_expires_at'), ['expires_at'], unique=False)
+
+    pending = op.get_bind().execute(sa.text(
+        'SELECT id, verification_code FROM users WHERE verification_code IS NOT NULL AND is_verified IS NOT TRUE'
+    )).all()
+    if pending:
+        expires_at = datetime.utcnow() + timedelta(minutes=10)
+        op.bulk_insert(verification_codes, [
+            {'user_id': user_id, 'code': code, 'attempts': 0, 'expires_at': expires_at}
+            for user_id, code in pending
+        ])
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('verification_code')
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('verification_code', sa.String(length=6), nullable=True))
+
+    with op.batch_alter_table('verification_codes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_verification_codes_expires_at'))
+
+    op.drop_table('verification_codes')
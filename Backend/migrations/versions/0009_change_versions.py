@@ -0,0 +1,40 @@
+"""delta sync by per-user change version instead of timestamps
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17 04:02:17.336920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('animals', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('change_version', sa.Integer(), server_default='0', nullable=False))
+        batch_op.drop_index('ix_animals_user_updated')
+        batch_op.create_index('ix_animals_user_change', ['user_id', 'change_version'], unique=False)
+
+    with op.batch_alter_table('animal_tombstones', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('change_version', sa.Integer(), server_default='0', nullable=False))
+        batch_op.drop_index('ix_animal_tombstones_user_deleted')
+        batch_op.create_index('ix_animal_tombstones_user_change', ['user_id', 'change_version'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('animal_tombstones', schema=None) as batch_op:
+        batch_op.drop_index('ix_animal_tombstones_user_change')
+        batch_op.create_index('ix_animal_tombstones_user_deleted', ['user_id', 'deleted_at'], unique=False)
+        batch_op.drop_column('change_version')
+
+    with op.batch_alter_table('animals', schema=None) as batch_op:
+        batch_op.drop_index('ix_animals_user_change')
+        batch_op.create_index('ix_animals_user_updated', ['user_id', 'updated_at'], unique=False)
+        batch_op.drop_column('change_version')
@@ -12,9 +12,10 @@ class User(db.Model):
     mobile = db.Column(db.String(15), unique=True, nullable=True)
     password_hash = db.Column(db.String(200), nullable=False)
     name = db.Column(db.String(100), nullable=False)
-    verification_code = db.Column(db.String(6), nullable=True)
     is_verified = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped with every change to the user's animals, see cache.py
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationship
     animals = db.relationship('Animal', backref='owner', lazy=True, cascade='all, delete-orphan')
@@ -38,40 +39,55 @@ class User(db.Model):
 
 class Animal(db.Model):
     __tablename__ = 'animals'
+    __table_args__ = (
+        # Listing pages newest first, keyset on (created_at, id)
+        db.Index('ix_animals_user_created', 'user_id', 'created_at', 'id'),
+        # Delta sync scans one user's rows by change_version
+        db.Index('ix_animals_user_change', 'user_id', 'change_version'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     animal_type = db.Column(db.String(50), nullable=False)
     photo_path = db.Column(db.String(200))
+    photo_status = db.Column(db.String(20))  # pending, ready or failed
     inseminated_date = db.Column(db.Date)
     delivery_date = db.Column(db.Date)
     calf_details = db.Column(db.Text)
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Owner's data_version when the row last changed, see cache.py
+    change_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationship
     injections = db.relationship('Injection', backref='animal', lazy=True, cascade='all, delete-orphan')
     
-    def to_dict(self):
-        return {
+    def to_dict(self, include_injections=True):
+        data = {
             'id': self.id,
             'name': self.name,
             'animal_type': self.animal_type,
             'photo_path': self.photo_path,
+            'photo_status': self.photo_status,
             'inseminated_date': self.inseminated_date.isoformat() if self.inseminated_date else None,
             'delivery_date': self.delivery_date.isoformat() if self.delivery_date else None,
             'calf_details': self.calf_details,
             'notes': self.notes,
-            'injections': [inj.to_dict() for inj in self.injections],
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
+        if include_injections:
+            data['injections'] = [inj.to_dict() for inj in self.injections]
+        return data
 
 
 class Injection(db.Model):
     __tablename__ = 'injections'
+    __table_args__ = (
+        db.Index('ix_injections_animal_date', 'animal_id', 'date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     animal_id = db.Column(db.Integer, db.ForeignKey('animals.id'), nullable=False)
@@ -84,4 +100,113 @@ class Injection(db.Model):
             'id': self.id,
             'date': self.date.isoformat(),
             'details': self.details
-        }
\ No newline at end of file
+        }
+
+
+class AnimalTombstone(db.Model):
+    """Marker left behind by a deleted animal so delta sync can report it"""
+    __tablename__ = 'animal_tombstones'
+    __table_args__ = (
+        db.Index('ix_animal_tombstones_user_change', 'user_id', 'change_version'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    animal_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    change_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+
+class Photo(db.Model):
+    """Reference count for a content-addressed photo that animals can share"""
+    __tablename__ = 'photos'
+    
+    filename = db.Column(db.String(200), primary_key=True)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class OutboxMessage(db.Model):
+    """Email or SMS waiting to be delivered by the outbox sender"""
+    __tablename__ = 'outbox'
+    __table_args__ = (
+        db.Index('ix_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(10), nullable=False)  # email or sms
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200))
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, sending, sent or failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+
+class VerificationCode(db.Model):
+    """Pending verification code for a user, valid until expires_at (see verification.py)"""
+    __tablename__ = 'verification_codes'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    code = db.Column(db.String(6), nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class IdempotencyKey(db.Model):
+    """Stored result of a batch operation so a replayed queue is applied once"""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    key = db.Column(db.String(100), nullable=False)
+    status_code = db.Column(db.Integer, nullable=False)
+    response = db.Column(db.Text, nullable=False)  # JSON body of the operation result
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class UpcomingEvent(db.Model):
+    """Derived due date for an animal (delivery or booster), rebuilt by reminders.py"""
+    __tablename__ = 'upcoming_events'
+    __table_args__ = (
+        # GET /api/reminders reads one user's events by date
+        db.Index('ix_upcoming_events_user_due', 'user_id', 'due_date'),
+        # The reminder job scans every user's events by date
+        db.Index('ix_upcoming_events_due_notified', 'due_date', 'notified_at'),
+        db.Index('ix_upcoming_events_animal', 'animal_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    animal_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # expected_delivery, delivery or booster
+    label = db.Column(db.String(100))  # vaccine name for boosters
+    injection_id = db.Column(db.Integer)  # injection a booster follows
+    due_date = db.Column(db.Date, nullable=False)
+    notified_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'animal_id': self.animal_id,
+            'kind': self.kind,
+            'label': self.label,
+            'due_date': self.due_date.isoformat()
+        }
+
+
+class HerdStat(db.Model):
+    """Running animal counts per user and type, kept by stats.py"""
+    __tablename__ = 'herd_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    animal_type = db.Column(db.String(50), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    pregnant = db.Column(db.Integer, nullable=False, default=0)
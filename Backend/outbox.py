@@ -0,0 +1,274 @@
+import json
+import smtplib
+import threading
+from datetime import datetime, timedelta
+from functools import partial
+from sqlalchemy import event, update
+from database import write_with_retry
+from sqlalchemy.orm import Session
+from metrics import timer
+from models import db, OutboxMessage
+
+# Email and SMS are written to the outbox table in the same transaction as
+# the change that triggers them, then delivered by a background sender so
+# requests never wait on SMTP or Twilio.
+_wake = threading.Event()
+_sender = None
+_sender_lock = threading.Lock()
+# Sent messages whose 'sent' status could not be saved yet (per process)
+_unsaved_sent = {}
+_unsaved_lock = threading.Lock()
+
+def enqueue_email(recipient, subject, body):
+    """Queue an email, delivered after the current transaction commits"""
+    _enqueue(OutboxMessage(channel='email', recipient=recipient, subject=subject, body=body))
+
+def enqueue_sms(recipient, body):
+    """Queue an SMS, delivered after the current transaction commits"""
+    _enqueue(OutboxMessage(channel='sms', recipient=recipient, body=body))
+
+def _enqueue(message):
+    db.session.add(message)
+    db.session.info['outbox_pending'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _wake_sender(session):
+    if session.info.pop('outbox_pending', False):
+        _wake.set()
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_pending(session):
+    session.info.pop('outbox_pending', None)
+
+
+class ConsoleBackend:
+    """Prints messages instead of sending them (offline development)"""
+
+    def send(self, message):
+        print(f"[outbox] {message.channel} to {message.recipient}: {message.subject or ''}\n{message.body}")
+
+    def close(self):
+        pass
+
+
+class FileBackend:
+    """Appends messages as JSON lines to a file (offline testing)"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, message):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'channel': message.channel,
+                'recipient': message.recipient,
+                'subject': message.subject,
+                'body': message.body,
+                'sent_at': datetime.utcnow().isoformat()
+            }) + '\n')
+
+    def close(self):
+        pass
+
+
+class LiveBackend:
+    """Sends email over one reused SMTP connection and SMS through Twilio"""
+
+    def __init__(self, app):
+        self.app = app
+        self._smtp = None
+        self._twilio = None
+
+    def send(self, message):
+        if message.channel == 'sms':
+            self._send_sms(message)
+        else:
+            self._send_email(message)
+
+    def _send_email(self, message):
+        from flask_mail import Message
+        msg = Message(subject=message.subject, recipients=[message.recipient], body=message.body)
+        try:
+            self._connection().send(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # The server dropped our idle connection, reconnect once
+            self.close()
+            self._connection().send(msg)
+
+    def _connection(self):
+        if self._smtp is None:
+            from flask_mail import Mail
+            connection = Mail(self.app).connect()
+            connection.__enter__()
+            self._smtp = connection
+        return self._smtp
+
+    def _send_sms(self, message):
+        if self._twilio is None:
+            account_sid = self.app.config['TWILIO_ACCOUNT_SID']
+            auth_token = self.app.config['TWILIO_AUTH_TOKEN']
+            if not account_sid or not auth_token:
+                raise RuntimeError('Twilio credentials not configured')
+            from twilio.rest import Client
+            self._twilio = Client(account_sid, auth_token)
+        self._twilio.messages.create(
+            body=message.body,
+            from_=self.app.config['TWILIO_PHONE_NUMBER'],
+            to=message.recipient
+        )
+
+    def close(self):
+        connection, self._smtp = self._smtp, None
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass
+
+
+def make_backend(app):
+    """Build the delivery backend named by OUTBOX_BACKEND"""
+    name = app.config['OUTBOX_BACKEND']
+    if name == 'console':
+        return ConsoleBackend()
+    if name == 'file':
+        return FileBackend(app.config['OUTBOX_FILE'])
+    return LiveBackend(app)
+
+def drain_outbox(app, backend, limit=None):
+    """Deliver due messages in one batch, returns how many were claimed
+
+    Messages are claimed with a compare-and-set on attempts, so several
+    processes can drain the same table without sending anything twice.
+    A claimed message that is never finished becomes due again after
+    OUTBOX_CLAIM_TIMEOUT seconds. No transaction is open while a message
+    is sent; each result is then written in its own transaction.
+    """
+    config = app.config
+    with app.app_context():
+        _record_unsaved()
+        claimed = write_with_retry(partial(_claim, config, limit or config['OUTBOX_BATCH_SIZE']))
+        if not claimed:
+            return 0
+
+        messages = OutboxMessage.query.filter(OutboxMessage.id.in_(claimed)).order_by(OutboxMessage.id).all()
+        for message in messages:
+            db.session.expunge(message)
+        db.session.rollback()
+
+        for message in messages:
+            try:
+                with timer(f'outbox_send_{message.channel}'):
+                    backend.send(message)
+            except Exception as e:
+                print(f"Error sending {message.channel} to {message.recipient}: {e}")
+                values = {'last_error': str(e)}
+                if message.attempts >= config['OUTBOX_MAX_ATTEMPTS']:
+                    values['status'] = 'failed'
+                else:
+                    delay = min(config['OUTBOX_RETRY_BASE'] * 2 ** (message.attempts - 1), config['OUTBOX_RETRY_MAX'])
+                    values.update(status='pending', next_attempt_at=datetime.utcnow() + timedelta(seconds=delay))
+                _record(message.id, values, attempts=message.attempts)
+                continue
+            _record(message.id, dict(status='sent', sent_at=datetime.utcnow(), last_error=None))
+
+        return len(claimed)
+
+def _claim(config, limit):
+    now = datetime.utcnow()
+    query = OutboxMessage.query.filter(
+        OutboxMessage.status.in_(('pending', 'sending')),
+        OutboxMessage.next_attempt_at <= now
+    )
+    with _unsaved_lock:
+        if _unsaved_sent:
+            query = query.filter(OutboxMessage.id.notin_(list(_unsaved_sent)))
+    due = query.order_by(OutboxMessage.next_attempt_at).limit(limit).all()
+
+    claimed = []
+    for message in due:
+        result = db.session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id == message.id, OutboxMessage.attempts == message.attempts)
+            .values(
+                status='sending',
+                attempts=message.attempts + 1,
+                next_attempt_at=now + timedelta(seconds=config['OUTBOX_CLAIM_TIMEOUT'])
+            )
+        )
+        if result.rowcount:
+            claimed.append(message.id)
+    db.session.commit()
+    return claimed
+
+def _record(message_id, values, attempts=None):
+    """Save a send result; a failure only applies to the claim it belongs to
+
+    A sent message whose result cannot be saved is kept in _unsaved_sent,
+    so this process never claims it again and retries the save next batch.
+    """
+    statement = update(OutboxMessage).where(OutboxMessage.id == message_id)
+    if attempts is not None:
+        statement = statement.where(OutboxMessage.attempts == attempts)
+
+    def save():
+        db.session.execute(statement.values(**values))
+        db.session.commit()
+
+    try:
+        write_with_retry(save)
+    except Exception as e:
+        print(f"Error saving outbox message {message_id}: {e}")
+        if values.get('status') == 'sent':
+            with _unsaved_lock:
+                _unsaved_sent[message_id] = values
+        return False
+    return True
+
+def _record_unsaved():
+    with _unsaved_lock:
+        unsaved = list(_unsaved_sent.items())
+    for message_id, values in unsaved:
+        if _record(message_id, values):
+            with _unsaved_lock:
+                _unsaved_sent.pop(message_id, None)
+
+
+class OutboxSender(threading.Thread):
+    """Background thread that keeps draining the outbox"""
+
+    def __init__(self, app):
+        super().__init__(name='outbox-sender', daemon=True)
+        self.app = app
+        self.backend = make_backend(app)
+        self._stopped = threading.Event()
+
+    def run(self):
+        batch_size = self.app.config['OUTBOX_BATCH_SIZE']
+        while not self._stopped.is_set():
+            _wake.clear()
+            try:
+                claimed = drain_outbox(self.app, self.backend)
+            except Exception as e:
+                print(f"Error draining outbox: {e}")
+                claimed = 0
+            if claimed >= batch_size:
+                continue
+            # Nothing left for now; drop the SMTP connection while idle
+            if not claimed:
+                self.backend.close()
+            _wake.wait(self.app.config['OUTBOX_POLL_INTERVAL'])
+        self.backend.close()
+
+    def stop(self):
+        self._stopped.set()
+        _wake.set()
+
+def start_outbox_sender(app):
+    """Start this process's outbox sender if it is not running yet"""
+    global _sender
+    with _sender_lock:
+        if _sender is None or not _sender.is_alive():
+            _sender = OutboxSender(app)
+            _sender.start()
+        return _sender
@@ -0,0 +1,124 @@
+import math
+import threading
+import time
+from flask import current_app
+
+try:
+    import redis
+except ImportError:  # optional, only needed for AUTH_REDIS_URL
+    redis = None
+
+# Token buckets for the auth endpoints, keyed by client IP and by account.
+# Each RATELIMITS rule is (burst, seconds): up to burst requests at once,
+# refilled evenly over that many seconds. Checks run before the database,
+# password hashing or the outbox are touched. Buckets live in this process
+# unless AUTH_REDIS_URL is set, in which case every worker shares them.
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+class LocalBuckets:
+    """Token buckets in this process's memory"""
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+
+    def take(self, key, burst, period):
+        """Take one token, returns 0 if allowed or the seconds until one is free"""
+        rate = burst / period
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / rate
+            self._hits += 1
+            if self._hits % self.PRUNE_EVERY == 0:
+                self._prune(now, period)
+        return wait
+
+    def _prune(self, now, period):
+        # A bucket untouched for a full period has refilled; forget it
+        stale = [key for key, (_, updated) in self._buckets.items() if now - updated > period]
+        for key in stale:
+            del self._buckets[key]
+
+
+class RedisBuckets:
+    """Token buckets in Redis, shared by every worker"""
+
+    # Refill, take and store atomically; returns milliseconds to wait
+    SCRIPT = '''
+local burst = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+local rate = burst / period
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(period * 1000))
+return wait
+'''
+
+    def __init__(self, url, prefix='naam:ratelimit:'):
+        if redis is None:
+            raise RuntimeError('AUTH_REDIS_URL is set but the redis package is not installed')
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(self.SCRIPT)
+        self.prefix = prefix
+
+    def take(self, key, burst, period):
+        try:
+            wait_ms = self.script(keys=[self.prefix + key], args=[burst, period, time.time()])
+        except redis.RedisError as e:
+            # Let requests through rather than locking everyone out
+            print(f"Rate limit check failed: {e}")
+            return 0
+        return int(wait_ms) / 1000
+
+
+def get_limiter():
+    """This process's bucket store, built on first use"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            url = current_app.config['AUTH_REDIS_URL']
+            _limiter = RedisBuckets(url) if url else LocalBuckets()
+        return _limiter
+
+def check(name, ip, account=None):
+    """Take a token from each of the rule's buckets
+
+    Returns None when the request may go ahead, otherwise the whole number
+    of seconds to wait (for Retry-After). The IP bucket is checked first so
+    a flood from one address never reaches the account buckets.
+    """
+    config = current_app.config
+    if not config['RATELIMIT_ENABLED']:
+        return None
+    rules = config['RATELIMITS'].get(name, {})
+    limiter = get_limiter()
+    for scope, value in (('ip', ip), ('account', account)):
+        if scope not in rules or value is None:
+            continue
+        burst, period = rules[scope]
+        wait = limiter.take(f'{name}:{scope}:{str(value).strip().lower()}', burst, period)
+        if wait:
+            return max(1, math.ceil(wait))
+    return None
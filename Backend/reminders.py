@@ -0,0 +1,209 @@
+import itertools
+import re
+from datetime import date, datetime, timedelta
+from sqlalchemy import delete, event, insert, select, update
+from sqlalchemy.orm import Session
+from models import db, User, Animal, Injection, UpcomingEvent
+from outbox import enqueue_email, enqueue_sms
+from stats import is_pregnant
+
+# Expected deliveries and booster dates are derived from animals and their
+# injections into the upcoming_events table. The events of every animal
+# touched by a transaction are rebuilt just before it commits, so reading
+# reminders is a range scan on (user_id, due_date) instead of a pass over
+# the whole herd. Bulk statements that bypass the ORM call mark_changed.
+
+GESTATION_DAYS = {'Cow': 283, 'Buffalo': 310, 'Goat': 150, 'Sheep': 147}
+
+# Label, pattern matched against injection details, days until the booster
+BOOSTERS = [
+    ('FMD', re.compile(r'\bfmd\b|foot.and.mouth'), 180),
+    ('HS', re.compile(r'\bhs\b|ha?emorrhagic'), 365),
+    ('BQ', re.compile(r'\bbq\b|black.?quarter'), 365),
+    ('Deworming', re.compile(r'deworm'), 90)
+]
+
+REFRESH_CHUNK = 500
+
+def mark_changed(session, animal_ids):
+    """Rebuild these animals' events when the session next commits"""
+    session.info.setdefault('reminder_animals', set()).update(animal_ids)
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    changed = set()
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Animal):
+            changed.add(obj.id)
+        elif isinstance(obj, Injection):
+            changed.add(obj.animal_id)
+    if changed:
+        mark_changed(session, changed)
+
+@event.listens_for(Session, 'before_commit')
+def _refresh_before_commit(session):
+    session.flush()
+    animal_ids = session.info.pop('reminder_animals', None)
+    if animal_ids:
+        refresh_events(session, animal_ids)
+
+def animal_events(animal, injections):
+    """Event rows for one animal, injections ordered by date"""
+    events = []
+
+    def add(kind, due_date, label=None, injection_id=None):
+        events.append({
+            'user_id': animal.user_id,
+            'animal_id': animal.id,
+            'kind': kind,
+            'label': label,
+            'injection_id': injection_id,
+            'due_date': due_date
+        })
+
+    gestation = GESTATION_DAYS.get(animal.animal_type)
+    if gestation and is_pregnant(animal.inseminated_date, animal.delivery_date):
+        add('expected_delivery', animal.inseminated_date + timedelta(days=gestation))
+    if animal.delivery_date:
+        add('delivery', animal.delivery_date)
+
+    # Only the latest dose of each vaccine schedules a booster
+    latest = {}
+    for injection in injections:
+        details = injection.details.lower()
+        for label, pattern, days in BOOSTERS:
+            if pattern.search(details):
+                latest[label] = (injection, days)
+    for label, (injection, days) in latest.items():
+        add('booster', injection.date + timedelta(days=days), label, injection.id)
+
+    return events
+
+def refresh_events(session, animal_ids):
+    """Bring the stored events of these animals in line with their rows
+
+    Events that still apply are left alone and keep their notified_at, so
+    editing an animal does not repeat reminders already sent.
+    """
+    animal_ids = sorted(animal_id for animal_id in animal_ids if animal_id is not None)
+    for start in range(0, len(animal_ids), REFRESH_CHUNK):
+        _refresh_chunk(session, animal_ids[start:start + REFRESH_CHUNK])
+
+def _refresh_chunk(session, animal_ids):
+    animals = session.execute(
+        select(Animal.id, Animal.user_id, Animal.animal_type, Animal.inseminated_date, Animal.delivery_date)
+        .where(Animal.id.in_(animal_ids))
+    ).all()
+
+    injections = {}
+    for row in session.execute(
+        select(Injection.id, Injection.animal_id, Injection.date, Injection.details)
+        .where(Injection.animal_id.in_(animal_ids))
+        .order_by(Injection.date, Injection.id)
+    ):
+        injections.setdefault(row.animal_id, []).append(row)
+
+    def event_key(row):
+        return (row['animal_id'], row['kind'], row['label'], row['injection_id'], row['due_date'])
+
+    wanted = {}
+    for animal in animals:
+        for row in animal_events(animal, injections.get(animal.id, [])):
+            wanted[event_key(row)] = row
+
+    existing = {
+        event_key(row._mapping): row.id for row in session.execute(
+            select(UpcomingEvent.id, UpcomingEvent.animal_id, UpcomingEvent.kind, UpcomingEvent.label,
+                   UpcomingEvent.injection_id, UpcomingEvent.due_date)
+            .where(UpcomingEvent.animal_id.in_(animal_ids))
+        )
+    }
+
+    stale = [event_id for key, event_id in existing.items() if key not in wanted]
+    if stale:
+        session.execute(delete(UpcomingEvent).where(UpcomingEvent.id.in_(stale)))
+
+    now = datetime.utcnow()
+    new = [dict(row, created_at=now) for key, row in wanted.items() if key not in existing]
+    if new:
+        session.execute(insert(UpcomingEvent), new)
+
+def rebuild_all_events(app):
+    """Recompute every animal's events, returns how many animals were seen"""
+    with app.app_context():
+        animal_ids = db.session.scalars(select(Animal.id)).all()
+        refresh_events(db.session, animal_ids)
+        # Events of animals that no longer exist
+        db.session.execute(delete(UpcomingEvent).where(UpcomingEvent.animal_id.not_in(select(Animal.id))))
+        db.session.commit()
+        return len(animal_ids)
+
+def upcoming_events(user_id, start, end):
+    """(event, animal name) pairs due between two dates, soonest first"""
+    return db.session.execute(
+        select(UpcomingEvent, Animal.name)
+        .join(Animal, Animal.id == UpcomingEvent.animal_id)
+        .where(UpcomingEvent.user_id == user_id, UpcomingEvent.due_date >= start, UpcomingEvent.due_date <= end)
+        .order_by(UpcomingEvent.due_date, UpcomingEvent.id)
+    ).all()
+
+def describe_event(event_row):
+    if event_row.kind == 'expected_delivery':
+        return 'expected delivery'
+    if event_row.kind == 'delivery':
+        return 'delivery'
+    return f'{event_row.label} booster'
+
+def send_due_reminders(app):
+    """Queue one message per user for events due within REMINDER_LEAD_DAYS
+
+    Events are claimed with a compare-and-set on notified_at in the same
+    transaction that queues the message, so overlapping runs never send a
+    reminder twice. Returns how many events were notified.
+    """
+    with app.app_context():
+        today = date.today()
+        horizon = today + timedelta(days=app.config['REMINDER_LEAD_DAYS'])
+        due = db.session.execute(
+            select(UpcomingEvent, Animal.name)
+            .join(Animal, Animal.id == UpcomingEvent.animal_id)
+            .where(
+                UpcomingEvent.due_date >= today,
+                UpcomingEvent.due_date <= horizon,
+                UpcomingEvent.notified_at.is_(None)
+            )
+            .order_by(UpcomingEvent.user_id, UpcomingEvent.due_date)
+        ).all()
+
+        now = datetime.utcnow()
+        claimed = {}
+        for event_row, animal_name in due:
+            result = db.session.execute(
+                update(UpcomingEvent)
+                .where(UpcomingEvent.id == event_row.id, UpcomingEvent.notified_at.is_(None))
+                .values(notified_at=now)
+            )
+            if result.rowcount:
+                claimed.setdefault(event_row.user_id, []).append((event_row, animal_name))
+
+        for user_id, events in claimed.items():
+            user = db.session.get(User, user_id)
+            lines = '\n'.join(
+                f'- {event_row.due_date.isoformat()}: {animal_name}, {describe_event(event_row)}'
+                for event_row, animal_name in events
+            )
+            if user.email:
+                enqueue_email(user.email, 'NAAM - Coming up on your farm', f'''Hello {user.name},
+
+Coming up in the next {app.config['REMINDER_LEAD_DAYS']} days:
+
+{lines}
+
+Best regards,
+NAAM Team
+''')
+            elif user.mobile:
+                enqueue_sms(user.mobile, f'NAAM reminders:\n{lines}')
+
+        db.session.commit()
+        return sum(len(events) for events in claimed.values())
@@ -1,12 +1,62 @@
-from flask import Blueprint, request, jsonify, session, send_from_directory
-from models import db, User, Animal, Injection
-from utils import (save_base64_image, delete_file, generate_verification_code,
-                   send_verification_email, mail, Message)
-from datetime import datetime
+from flask import Blueprint, Response, request, jsonify, session, send_from_directory, stream_with_context
+from models import db, User, Animal, Injection, AnimalTombstone, IdempotencyKey
+from utils import (stage_base64_upload, stage_upload, delete_file, delete_photo,
+                   photo_variant, is_content_addressed, PHOTO_SIZES,
+                   send_verification_email,
+                   encode_cursor, decode_cursor)
+from outbox import enqueue_email
+import cache
+import metrics
+import ratelimit
+import reminders
+import search
+import serializers
+import stats
+import transfer
+import verification
+from jobs import reserve_photo_slot, release_photo_slot, submit_photo_job, release_photo
+from sqlalchemy import delete, insert, select, tuple_, update
+from datetime import date, datetime, timedelta
+import json
+import mimetypes
 import os
+import time
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.security import safe_join
+from werkzeug.wsgi import get_input_stream
+from contextlib import contextmanager
+from zlib import adler32
 
 api = Blueprint('api', __name__)
 
+# Listing pagination
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+EXPORT_MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+PHOTO_QUEUE_FULL = 'Photo processing is busy, please retry shortly'
+
+
+class OperationError(Exception):
+    """An animal edit rejected with a client error"""
+    
+    def __init__(self, message, status_code=400, headers=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def _throttled(rule, account=None):
+    """429 response if the client IP or account is over the rule's limit, else None"""
+    wait = ratelimit.check(rule, request.remote_addr, account)
+    if wait is None:
+        return None
+    response = jsonify({'error': 'Too many attempts, please try again later'})
+    response.headers['Retry-After'] = str(wait)
+    return response, 429
+
+
 # Auth Routes
 @api.route('/register', methods=['POST'])
 def register():
@@ -17,6 +67,10 @@ def register():
         password = data.get('password')
         name = data.get('name')
         
+        throttled = _throttled('register')
+        if throttled:
+            return throttled
+        
         if not email or not password or not name:
             return jsonify({'error': 'Missing required fields'}), 400
         
@@ -24,22 +78,18 @@ def register():
         if User.query.filter_by(email=email).first():
             return jsonify({'error': 'Email already exists'}), 400
         
-        # Generate verification code
-        code = generate_verification_code()
-        
         # Create new user
-        user = User(email=email, name=name, verification_code=code)
+        user = User(email=email, name=name)
         user.set_password(password)
         
         db.session.add(user)
-        db.session.commit()
+        db.session.flush()
+        code = verification.issue_code(user.id)
         
-        # Send email verification (will show code in console if email not configured)
+        # Queued in the same transaction, the outbox sender delivers it
         message = f'Verification code sent to {email}. Code: {code}'
-        try:
-            send_verification_email(email, code, name)
-        except:
-            print(f"Verification code for {email}: {code}")
+        send_verification_email(email, code, name)
+        db.session.commit()
         
         return jsonify({
             'message': message,
@@ -61,16 +111,24 @@ def verify_code():
         if not user_id or not code:
             return jsonify({'error': 'Missing user_id or code'}), 400
         
+        throttled = _throttled('verify', user_id)
+        if throttled:
+            return throttled
+        
         user = User.query.get(user_id)
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        if user.verification_code != code:
+        result = verification.check_code(user.id, code)
+        if result != 'valid':
+            # Keeps the failed attempt count
+            db.session.commit()
+            if result == 'expired':
+                return jsonify({'error': 'Verification code expired, please request a new one'}), 400
             return jsonify({'error': 'Invalid verification code'}), 400
         
         # Mark as verified
         user.is_verified = True
-        user.verification_code = None
         db.session.commit()
         
         # Set session
@@ -94,24 +152,25 @@ def resend_code():
         if not user_id:
             return jsonify({'error': 'Missing user_id'}), 400
         
+        throttled = _throttled('resend_code', user_id)
+        if throttled:
+            return throttled
+        
         user = User.query.get(user_id)
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Generate new code
-        code = generate_verification_code()
-        user.verification_code = code
-        db.session.commit()
+        # Generate new code, replacing the old one
+        code = verification.issue_code(user.id)
         
         # Send code
         message = f'Code resent to {user.email}. Code: {code}'
-        try:
-            send_verification_email(user.email, code, user.name)
-        except:
-            print(f"Verification code for {user.email}: {code}")
+        send_verification_email(user.email, code, user.name)
+        db.session.commit()
         
         return jsonify({'message': message}), 200
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @api.route('/login', methods=['POST'])
@@ -125,8 +184,18 @@ def login():
         if not email or not password:
             return jsonify({'error': 'Missing email or password'}), 400
         
+        throttled = _throttled('login', email)
+        if throttled:
+            return throttled
+        
         user = User.query.filter_by(email=email).first()
         
+        # Password hashing is slow on purpose; end the transaction first so
+        # it holds no database lock meanwhile
+        if user:
+            db.session.expunge(user)
+        db.session.rollback()
+        
         if not user or not user.check_password(password):
             return jsonify({'error': 'Invalid credentials'}), 401
         
@@ -137,12 +206,8 @@ def login():
                 'requires_verification': True
             }), 403
         
-        # Send login notification
-        try:
-            msg = Message(
-                subject='NAAM - Login Notification',
-                recipients=[user.email],
-                body=f'''Hello {user.name},
+        # Queue login notification
+        enqueue_email(user.email, 'NAAM - Login Notification', f'''Hello {user.name},
 
 Someone just logged into your NAAM account.
 
@@ -151,11 +216,8 @@ Time: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
 If this wasn't you, please change your password immediately.
 
 Thank you,
-NAAM Team'''
-            )
-            mail.send(msg)
-        except:
-            pass
+NAAM Team''')
+        db.session.commit()
         
         # Set session
         session['user_id'] = user.id
@@ -165,6 +227,7 @@ NAAM Team'''
             'user': user.to_dict()
         }), 200
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @api.route('/logout', methods=['POST'])
@@ -189,76 +252,278 @@ def get_current_user():
 # Animal Routes (keep all existing animal routes)
 @api.route('/animals', methods=['GET'])
 def get_animals():
-    """Get all animals for current user"""
+    """Get a page of animals for current user
+
+    Query parameters:
+        limit   -- page size (default 50, max 200)
+        cursor  -- next_cursor value returned by the previous page
+        fields  -- comma separated subset of animal fields to return
+        include -- 'injections' to batch-load each animal's injections
+
+    Pages are cached until the user's animals change. The ETag follows the
+    user's data version, so If-None-Match gets a 304 while nothing changed.
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    
+    include = {part.strip() for part in request.args.get('include', '').split(',') if part.strip()}
+    fields = [part.strip() for part in request.args.get('fields', '').split(',') if part.strip()]
+    
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            created_at, animal_id = decode_cursor(cursor)
+            created_at = datetime.fromisoformat(created_at)
+            animal_id = int(animal_id)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    # Unchanged since the client's copy: no query, no body. The version is
+    # read before the rows, so it is also a safe /animals/changes token
+    version = cache.data_version(user_id)
+    sync_token = encode_cursor('v', version)
+    etag = f'{user_id}-{version}'
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+    
+    listing_cache = cache.get_cache()
+    key = (user_id, version, limit, cursor or '', ','.join(fields), 'injections' in include)
+    page = listing_cache.get(key) if listing_cache else None
+    
+    if page is None:
+        # created_at is always read because the next cursor is built from it
+        statement = serializers.animal_select(fields and set(fields) | {'created_at'}).where(Animal.user_id == user_id)
+        
+        # Keyset pagination on (created_at, id), newest first
+        if cursor:
+            # Row-value comparison lets the index seek straight to the cursor
+            statement = statement.where(tuple_(Animal.created_at, Animal.id) < tuple_(created_at, animal_id))
+        
+        statement = statement.order_by(Animal.created_at.desc(), Animal.id.desc()).limit(limit + 1)
+        
+        # Injections for the whole page come from a single IN query
+        animals = serializers.fetch_animals(statement, include_injections='injections' in include)
+        has_more = len(animals) > limit
+        animals = animals[:limit]
+        
+        next_cursor = None
+        if has_more:
+            last = animals[-1]
+            next_cursor = encode_cursor(last['created_at'].isoformat(), last['id'])
+        
+        if fields and 'created_at' not in fields:
+            for animal in animals:
+                del animal['created_at']
+        
+        page = {'animals': animals, 'next_cursor': next_cursor}
+        if listing_cache:
+            listing_cache.set(key, page)
+    
+    response = jsonify({
+        'animals': page['animals'],
+        'next_cursor': page['next_cursor'],
+        'sync_token': sync_token
+    })
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response, 200
+
+@api.route('/animals/changes', methods=['GET'])
+def get_animal_changes():
+    """Get animals created, updated or deleted since a sync token
+
+    Without a since token every animal is returned. The response's
+    sync_token is passed back as since on the next call. Tokens carry the
+    user's data_version, which grows in commit order, so a write that
+    commits after a sync is always in the next one. Timestamp tokens from
+    older clients get a full resync.
+    """
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    animals = Animal.query.filter_by(user_id=user_id).order_by(Animal.created_at.desc()).all()
-    return jsonify({'animals': [animal.to_dict() for animal in animals]}), 200
+    # Read before the rows: anything committed later has a higher version
+    sync_token = encode_cursor('v', cache.data_version(user_id))
+    
+    since = None
+    if request.args.get('since'):
+        try:
+            parts = decode_cursor(request.args['since'])
+            if parts[0] == 'v':
+                since = int(parts[1])
+            else:
+                datetime.fromisoformat(parts[0])
+        except (ValueError, IndexError):
+            return jsonify({'error': 'Invalid sync token'}), 400
+    
+    statement = serializers.animal_select().where(Animal.user_id == user_id)
+    if since is not None:
+        statement = statement.where(Animal.change_version > since)
+    animals = serializers.fetch_animals(statement.order_by(Animal.change_version, Animal.id), include_injections=True)
+    
+    deleted = []
+    if since is not None:
+        deleted = list(db.session.scalars(select(AnimalTombstone.animal_id).where(
+            AnimalTombstone.user_id == user_id,
+            AnimalTombstone.change_version > since
+        )))
+    
+    return jsonify({
+        'animals': animals,
+        'deleted': deleted,
+        'sync_token': sync_token
+    }), 200
 
-@api.route('/animals', methods=['POST'])
-def create_animal():
-    """Create new animal"""
+@api.route('/animals/search', methods=['GET'])
+def search_animals():
+    """Full-text search over names, notes, calf details and injections
+
+    Query parameters:
+        q       -- words to find; all must match, as word prefixes
+        limit   -- page size (default 50, max 200)
+        cursor  -- next_cursor value returned by the previous page
+        include -- 'injections' to include each animal's injections
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    if not search.search_supported():
+        return jsonify({'error': 'Search is not available on this database'}), 501
+    
+    terms = search.search_terms(request.args.get('q', ''))
+    if not terms:
+        return jsonify({'error': 'Missing search query'}), 400
+    
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    
+    # Keyset pagination on (score, id), best match first
+    after = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            score, animal_id = decode_cursor(cursor)
+            after = (float(score), int(animal_id))
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    matches = search.search_animals(user_id, terms, limit + 1, after)
+    has_more = len(matches) > limit
+    matches = matches[:limit]
+    
+    next_cursor = None
+    if has_more:
+        animal_id, score = matches[-1]
+        next_cursor = encode_cursor(repr(score), animal_id)
+    
+    statement = serializers.animal_select().where(
+        Animal.user_id == user_id,
+        Animal.id.in_([animal_id for animal_id, _ in matches])
+    )
+    include_injections = 'injections' in request.args.get('include', '')
+    animals = {animal['id']: animal for animal in serializers.fetch_animals(statement, include_injections)}
+    
+    return jsonify({
+        'animals': [animals[animal_id] for animal_id, _ in matches if animal_id in animals],
+        'next_cursor': next_cursor
+    }), 200
+
+@api.route('/animals/export', methods=['GET'])
+def export_animals():
+    """Stream the whole herd as NDJSON (default) or CSV (?format=csv)"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_MIMETYPES:
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    
+    return Response(
+        stream_with_context(transfer.export_animals(user_id, fmt)),
+        mimetype=EXPORT_MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename=naam-herd.{fmt}'}
+    )
+
+@api.route('/animals/import', methods=['POST'])
+def import_animals():
+    """Add animals from an NDJSON or CSV upload (the export format)
+
+    The request body is the file itself. CSV is picked with ?format=csv or
+    a text/csv Content-Type. The whole file is checked before anything is
+    written, so a bad line imports nothing; it is then committed in batches
+    of IMPORT_BATCH_SIZE.
+    """
     try:
         user_id = session.get('user_id')
         if not user_id:
             return jsonify({'error': 'Not authenticated'}), 401
         
-        data = request.get_json()
-        
-        # Required fields
-        name = data.get('name')
-        animal_type = data.get('type')
-        
-        if not name or not animal_type:
-            return jsonify({'error': 'Missing required fields'}), 400
+        from flask import current_app
+        fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+        if fmt not in EXPORT_MIMETYPES:
+            return jsonify({'error': 'format must be ndjson or csv'}), 400
         
-        # Create animal
-        animal = Animal(
-            user_id=user_id,
-            name=name,
-            animal_type=animal_type,
-            calf_details=data.get('calfDetails'),
-            notes=data.get('notes')
-        )
+        # Imports may be far larger than MAX_CONTENT_LENGTH allows for other requests
+        stream = get_input_stream(request.environ, max_content_length=current_app.config['IMPORT_MAX_BYTES'])
+        try:
+            imported = transfer.import_animals(user_id, stream, fmt, current_app.config['IMPORT_BATCH_SIZE'])
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+        db.session.commit()
         
-        # Handle dates
-        if data.get('inseminatedDate'):
-            animal.inseminated_date = datetime.fromisoformat(data['inseminatedDate']).date()
-        if data.get('deliveryDate'):
-            animal.delivery_date = datetime.fromisoformat(data['deliveryDate']).date()
+        return jsonify({
+            'message': 'Animals imported successfully',
+            'imported': imported
+        }), 201
+    except RequestEntityTooLarge:
+        db.session.rollback()
+        return jsonify({'error': 'Import file is too large'}), 413
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/animals', methods=['POST'])
+def create_animal():
+    """Create new animal"""
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'Not authenticated'}), 401
         
-        # Handle photo
-        if data.get('photoData'):
-            from flask import current_app
-            filename = save_base64_image(
-                data['photoData'],
-                current_app.config['UPLOAD_FOLDER'],
-                f"animal_{name}"
-            )
-            if filename:
-                animal.photo_path = filename
-        
-        db.session.add(animal)
-        db.session.flush()
+        animal, staged_photo = _apply_create(user_id, request.get_json())
         
-        # Handle injections
-        if data.get('injections'):
-            for inj_data in data['injections']:
-                injection = Injection(
-                    animal_id=animal.id,
-                    date=datetime.fromisoformat(inj_data['date']).date(),
-                    details=inj_data['details']
-                )
-                db.session.add(injection)
+        try:
+            db.session.commit()
+        except Exception:
+            _discard_staged_photo(staged_photo)
+            raise
         
-        db.session.commit()
+        if staged_photo:
+            _submit_photo(animal, staged_photo)
         
         return jsonify({
             'message': 'Animal created successfully',
             'animal': animal.to_dict()
         }), 201
+    except OperationError as e:
+        db.session.rollback()
+        return _operation_error(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -275,61 +540,24 @@ def update_animal(animal_id):
         if not animal:
             return jsonify({'error': 'Animal not found'}), 404
         
-        data = request.get_json()
+        staged_photo = _apply_update(animal, request.get_json())
         
-        # Update fields
-        if 'name' in data:
-            animal.name = data['name']
-        if 'type' in data:
-            animal.animal_type = data['type']
-        if 'calfDetails' in data:
-            animal.calf_details = data['calfDetails']
-        if 'notes' in data:
-            animal.notes = data['notes']
-        
-        # Update dates
-        if 'inseminatedDate' in data:
-            animal.inseminated_date = datetime.fromisoformat(data['inseminatedDate']).date() if data['inseminatedDate'] else None
-        if 'deliveryDate' in data:
-            animal.delivery_date = datetime.fromisoformat(data['deliveryDate']).date() if data['deliveryDate'] else None
-        
-        # Update photo
-        if 'photoData' in data and data['photoData']:
-            from flask import current_app
-            # Delete old photo
-            if animal.photo_path:
-                old_path = os.path.join(current_app.config['UPLOAD_FOLDER'], animal.photo_path)
-                delete_file(old_path)
-            
-            # Save new photo
-            filename = save_base64_image(
-                data['photoData'],
-                current_app.config['UPLOAD_FOLDER'],
-                f"animal_{animal.name}"
-            )
-            if filename:
-                animal.photo_path = filename
-        
-        # Update injections
-        if 'injections' in data:
-            # Delete old injections
-            Injection.query.filter_by(animal_id=animal.id).delete()
-            
-            # Add new injections
-            for inj_data in data['injections']:
-                injection = Injection(
-                    animal_id=animal.id,
-                    date=datetime.fromisoformat(inj_data['date']).date(),
-                    details=inj_data['details']
-                )
-                db.session.add(injection)
+        try:
+            db.session.commit()
+        except Exception:
+            _discard_staged_photo(staged_photo)
+            raise
         
-        db.session.commit()
+        if staged_photo:
+            _submit_photo(animal, staged_photo)
         
         return jsonify({
             'message': 'Animal updated successfully',
             'animal': animal.to_dict()
         }), 200
+    except OperationError as e:
+        db.session.rollback()
+        return _operation_error(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -346,23 +574,621 @@ def delete_animal(animal_id):
         if not animal:
             return jsonify({'error': 'Animal not found'}), 404
         
-        # Delete photo
-        if animal.photo_path:
+        unused_photo = _apply_delete(animal)
+        db.session.commit()
+        
+        if unused_photo:
             from flask import current_app
-            photo_path = os.path.join(current_app.config['UPLOAD_FOLDER'], animal.photo_path)
-            delete_file(photo_path)
+            delete_photo(current_app.config['UPLOAD_FOLDER'], unused_photo)
+        
+        return jsonify({'message': 'Animal deleted successfully'}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/batch', methods=['POST'])
+def apply_batch():
+    """Apply a queue of offline edits in one transaction
+
+    Body: {"operations": [{"key": ..., "op": "create" | "update" | "delete",
+    "id": ..., "data": {...}}]}, where data is what the single-animal route
+    takes. Update and delete can name an animal created earlier in the same
+    queue with "ref": "<key of the create>" instead of "id".
+
+    Each operation runs in a savepoint, so a rejected one does not undo the
+    others, and its result is stored under its key. Replaying a key returns
+    the stored result without applying the operation again. Operations that
+    fail with a server error, including a full photo queue (503), are not
+    stored and run again on replay.
+    """
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'Not authenticated'}), 401
+        
+        from flask import current_app
+        data = request.get_json(silent=True) or {}
+        operations = data.get('operations')
+        if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+            return jsonify({'error': 'operations must be a list of objects'}), 400
+        if len(operations) > current_app.config['BATCH_MAX_OPERATIONS']:
+            return jsonify({'error': f"At most {current_app.config['BATCH_MAX_OPERATIONS']} operations per batch"}), 400
+        
+        keys = [op.get('key') for op in operations]
+        if not all(isinstance(key, str) and 0 < len(key) <= 100 for key in keys):
+            return jsonify({'error': 'Every operation needs a key of up to 100 characters'}), 400
+        if len(set(keys)) != len(keys):
+            return jsonify({'error': 'Duplicate operation key'}), 400
+        
+        stored = {
+            row.key: row for row in
+            IdempotencyKey.query.filter(IdempotencyKey.user_id == user_id, IdempotencyKey.key.in_(keys))
+        } if keys else {}
+        
+        results = []
+        created_ids = {}
+        staged_photos = []
+        unused_photos = []
+        for operation in operations:
+            key = operation['key']
+            
+            if key in stored:
+                status_code, body = stored[key].status_code, json.loads(stored[key].response)
+                result = {'key': key, 'status': status_code, 'body': body, 'replayed': True}
+            else:
+                staged_photo = None
+                savepoint = db.session.begin_nested()
+                try:
+                    status_code, body, staged_photo, unused_photo = _apply_operation(user_id, operation, created_ids)
+                    savepoint.commit()
+                except OperationError as e:
+                    savepoint.rollback()
+                    _discard_staged_photo(staged_photo)
+                    status_code, body = e.status_code, {'error': str(e)}
+                    if status_code >= 500:
+                        # Retryable (e.g. the photo queue is full): not stored
+                        results.append({'key': key, 'status': status_code, 'body': body})
+                        continue
+                except Exception as e:
+                    savepoint.rollback()
+                    _discard_staged_photo(staged_photo)
+                    results.append({'key': key, 'status': 500, 'body': {'error': str(e)}})
+                    continue
+                else:
+                    if staged_photo:
+                        staged_photos.append((body['animal']['id'], staged_photo))
+                    if unused_photo:
+                        unused_photos.append(unused_photo)
+                
+                db.session.add(IdempotencyKey(
+                    user_id=user_id,
+                    key=key,
+                    status_code=status_code,
+                    response=json.dumps(body)
+                ))
+                result = {'key': key, 'status': status_code, 'body': body}
+            
+            if operation.get('op') == 'create' and status_code == 201:
+                created_ids[key] = body['animal']['id']
+            results.append(result)
+        
+        try:
+            db.session.commit()
+        except Exception:
+            for _, staged_photo in staged_photos:
+                _discard_staged_photo(staged_photo)
+            raise
+        
+        app = current_app._get_current_object()
+        for animal_id, staged_photo in staged_photos:
+            submit_photo_job(app, animal_id, staged_photo)
+        for filename in unused_photos:
+            delete_photo(app.config['UPLOAD_FOLDER'], filename)
+        
+        return jsonify({'results': results}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+def _operation_error(error):
+    response = jsonify({'error': str(error)})
+    response.headers.update(error.headers)
+    return response, error.status_code
+
+def _apply_operation(user_id, operation, created_ids):
+    """Run one batch operation, returns (status, body, staged photo, unused photo)"""
+    action = operation.get('op')
+    data = operation.get('data') or {}
+    if action not in ('create', 'update', 'delete'):
+        raise OperationError('Unknown operation')
+    if not isinstance(data, dict):
+        raise OperationError('data must be an object')
+    
+    if action == 'create':
+        animal, staged_photo = _apply_create(user_id, data)
+        with _discarding(staged_photo):
+            body = {'message': 'Animal created successfully', 'animal': animal.to_dict()}
+        return 201, body, staged_photo, None
+    
+    animal_id = operation.get('id')
+    if animal_id is None:
+        animal_id = created_ids.get(operation.get('ref'))
+    animal = Animal.query.filter_by(id=animal_id, user_id=user_id).first() if animal_id is not None else None
+    if not animal:
+        raise OperationError('Animal not found', 404)
+    
+    if action == 'update':
+        staged_photo = _apply_update(animal, data)
+        with _discarding(staged_photo):
+            db.session.flush()
+            body = {'message': 'Animal updated successfully', 'animal': animal.to_dict()}
+        return 200, body, staged_photo, None
+    
+    unused_photo = _apply_delete(animal)
+    return 200, {'message': 'Animal deleted successfully'}, None, unused_photo
+
+def _apply_create(user_id, data):
+    """Add a new animal to the session, returns (animal, staged photo)"""
+    # Required fields
+    name = data.get('name')
+    animal_type = data.get('type')
+    
+    if not name or not animal_type:
+        raise OperationError('Missing required fields')
+    
+    animal = Animal(
+        user_id=user_id,
+        name=name,
+        animal_type=animal_type,
+        calf_details=data.get('calfDetails'),
+        notes=data.get('notes')
+    )
+    
+    # Handle dates
+    if data.get('inseminatedDate'):
+        animal.inseminated_date = datetime.fromisoformat(data['inseminatedDate']).date()
+    if data.get('deliveryDate'):
+        animal.delivery_date = datetime.fromisoformat(data['deliveryDate']).date()
+    
+    db.session.add(animal)
+    db.session.flush()
+    
+    # Handle injections
+    if data.get('injections'):
+        _sync_injections(animal, data['injections'])
+    
+    # Handle photo
+    staged_photo = None
+    if data.get('photoData'):
+        staged_photo = _stage_photo_data(data['photoData'])
+        animal.photo_status = 'pending'
+    
+    return animal, staged_photo
+
+def _apply_update(animal, data):
+    """Apply posted changes to an animal, returns the staged photo if any"""
+    # Update fields
+    if 'name' in data:
+        animal.name = data['name']
+    if 'type' in data:
+        animal.animal_type = data['type']
+    if 'calfDetails' in data:
+        animal.calf_details = data['calfDetails']
+    if 'notes' in data:
+        animal.notes = data['notes']
+    
+    # Update dates
+    if 'inseminatedDate' in data:
+        animal.inseminated_date = datetime.fromisoformat(data['inseminatedDate']).date() if data['inseminatedDate'] else None
+    if 'deliveryDate' in data:
+        animal.delivery_date = datetime.fromisoformat(data['deliveryDate']).date() if data['deliveryDate'] else None
+    
+    # Injection-only edits must still show up in /animals/changes
+    animal.updated_at = datetime.utcnow()
+    
+    # Update injections, touching only the rows that changed
+    if 'injections' in data:
+        _sync_injections(animal, data['injections'])
+    
+    # Update photo (the old one is replaced once the new one is processed).
+    # Flushed first, so a rejected field fails before a photo is staged
+    staged_photo = None
+    if 'photoData' in data and data['photoData']:
+        db.session.flush()
+        staged_photo = _stage_photo_data(data['photoData'])
+        animal.photo_status = 'pending'
+    
+    return staged_photo
+
+def _apply_delete(animal):
+    """Delete an animal and leave a tombstone, returns its photo if now unused"""
+    # Photo files go once no other animal shares them
+    unused_photo = None
+    if animal.photo_path and release_photo(animal.photo_path):
+        unused_photo = animal.photo_path
+    
+    db.session.add(AnimalTombstone(animal_id=animal.id, user_id=animal.user_id))
+    db.session.delete(animal)
+    return unused_photo
+
+def _sync_injections(animal, injections):
+    """Make an animal's stored injections match the posted list
+
+    Entries carrying the id of an existing injection update it in place,
+    entries without one are inserted and stored injections missing from the
+    list are deleted. Each kind of change is one bulk statement.
+    """
+    existing = {
+        row.id: row for row in db.session.execute(
+            select(Injection.id, Injection.date, Injection.details).where(Injection.animal_id == animal.id)
+        )
+    }
+    
+    inserts, updates, kept = [], [], set()
+    for inj_data in injections:
+        date = datetime.fromisoformat(inj_data['date']).date()
+        details = inj_data['details']
+        inj_id = inj_data.get('id')
+        inj_id = int(inj_id) if inj_id is not None else None
+        
+        if inj_id in existing and inj_id not in kept:
+            kept.add(inj_id)
+            current = existing[inj_id]
+            if current.date != date or current.details != details:
+                updates.append({'id': inj_id, 'date': date, 'details': details})
+        else:
+            inserts.append({'animal_id': animal.id, 'date': date, 'details': details, 'created_at': datetime.utcnow()})
+    
+    deletes = [inj_id for inj_id in existing if inj_id not in kept]
+    if deletes:
+        db.session.execute(delete(Injection).where(Injection.id.in_(deletes)))
+    if updates:
+        db.session.execute(update(Injection), updates)
+    if inserts:
+        db.session.execute(insert(Injection), inserts)
+    db.session.expire(animal, ['injections'])
+    reminders.mark_changed(db.session, [animal.id])
+
+def _get_owned_animal(animal_id):
+    """Current user's animal, or (None, error response)"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return None, (jsonify({'error': 'Not authenticated'}), 401)
+    
+    animal = Animal.query.filter_by(id=animal_id, user_id=user_id).first()
+    if not animal:
+        return None, (jsonify({'error': 'Animal not found'}), 404)
+    return animal, None
+
+@api.route('/animals/<int:animal_id>/injections', methods=['POST'])
+def create_injection(animal_id):
+    """Add one injection to an animal"""
+    try:
+        animal, error = _get_owned_animal(animal_id)
+        if error:
+            return error
         
-        db.session.delete(animal)
+        data = request.get_json()
+        if not data.get('date') or not data.get('details'):
+            return jsonify({'error': 'Missing required fields'}), 400
+        
+        injection = Injection(
+            animal_id=animal.id,
+            date=datetime.fromisoformat(data['date']).date(),
+            details=data['details']
+        )
+        db.session.add(injection)
+        animal.updated_at = datetime.utcnow()
         db.session.commit()
         
-        return jsonify({'message': 'Animal deleted successfully'}), 200
+        return jsonify({
+            'message': 'Injection added successfully',
+            'injection': injection.to_dict()
+        }), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/animals/<int:animal_id>/injections/<int:injection_id>', methods=['PATCH'])
+def update_injection(animal_id, injection_id):
+    """Change the date or details of one injection"""
+    try:
+        animal, error = _get_owned_animal(animal_id)
+        if error:
+            return error
+        
+        injection = Injection.query.filter_by(id=injection_id, animal_id=animal.id).first()
+        if not injection:
+            return jsonify({'error': 'Injection not found'}), 404
+        
+        data = request.get_json()
+        if data.get('date'):
+            injection.date = datetime.fromisoformat(data['date']).date()
+        if data.get('details'):
+            injection.details = data['details']
+        animal.updated_at = datetime.utcnow()
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Injection updated successfully',
+            'injection': injection.to_dict()
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/animals/<int:animal_id>/injections/<int:injection_id>', methods=['DELETE'])
+def delete_injection(animal_id, injection_id):
+    """Remove one injection"""
+    try:
+        animal, error = _get_owned_animal(animal_id)
+        if error:
+            return error
+        
+        injection = Injection.query.filter_by(id=injection_id, animal_id=animal.id).first()
+        if not injection:
+            return jsonify({'error': 'Injection not found'}), 404
+        
+        db.session.delete(injection)
+        animal.updated_at = datetime.utcnow()
+        db.session.commit()
+        
+        return jsonify({'message': 'Injection deleted successfully'}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/stats', methods=['GET'])
+def get_stats():
+    """Dashboard numbers: herd counts by type, pregnancies, deliveries due
+    and injections given in the last ?days= days (default 30)"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    from flask import current_app
+    try:
+        days = min(max(int(request.args.get('days', 30)), 1), current_app.config['REMINDER_MAX_DAYS'])
+    except ValueError:
+        return jsonify({'error': 'Invalid days'}), 400
+    
+    return jsonify(stats.herd_stats(user_id, days)), 200
+
+@api.route('/reminders', methods=['GET'])
+def get_reminders():
+    """Deliveries and boosters due in the next ?days= days (default 30)"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    from flask import current_app
+    try:
+        days = min(max(int(request.args.get('days', 30)), 0), current_app.config['REMINDER_MAX_DAYS'])
+    except ValueError:
+        return jsonify({'error': 'Invalid days'}), 400
+    
+    today = date.today()
+    events = reminders.upcoming_events(user_id, today, today + timedelta(days=days))
+    
+    return jsonify({
+        'events': [
+            dict(event.to_dict(), animal_name=animal_name, description=reminders.describe_event(event))
+            for event, animal_name in events
+        ]
+    }), 200
+
+@api.route('/animals/<int:animal_id>/photo', methods=['PUT'])
+def upload_animal_photo(animal_id):
+    """Replace an animal's photo
+
+    Accepts either a multipart form with a 'photo' file field or the raw
+    image bytes as the request body. The photo is processed in the
+    background; poll GET /animals/<id>/photo/status for the result.
+    """
+    staged_photo = None
+    from flask import current_app
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'Not authenticated'}), 401
+        
+        if request.mimetype == 'multipart/form-data':
+            photo = request.files.get('photo')
+            if not photo:
+                return jsonify({'error': 'Missing photo'}), 400
+            stream = photo.stream
+        else:
+            stream = request.stream
+        
+        if not reserve_photo_slot(current_app):
+            return _photo_queue_full()
+        
+        # Read the upload before touching the database, so a slow client
+        # never holds the write transaction
+        try:
+            with metrics.timer('photo_stage'):
+                staged_photo = stage_upload(stream)
+        except Exception:
+            release_photo_slot(current_app)
+            raise
+        
+        animal = Animal.query.filter_by(id=animal_id, user_id=user_id).first()
+        if not animal:
+            release_photo_slot(current_app)
+            delete_file(staged_photo)
+            return jsonify({'error': 'Animal not found'}), 404
+        
+        try:
+            animal.photo_status = 'pending'
+            db.session.commit()
+        except Exception:
+            release_photo_slot(current_app)
+            raise
+        
+        _submit_photo(animal, staged_photo)
+        
+        return jsonify({
+            'message': 'Photo upload accepted',
+            'animal': animal.to_dict()
+        }), 202
+    except RequestEntityTooLarge:
+        db.session.rollback()
+        delete_file(staged_photo)
+        return jsonify({'error': 'Photo is too large'}), 413
     except Exception as e:
         db.session.rollback()
+        delete_file(staged_photo)
         return jsonify({'error': str(e)}), 500
 
+@api.route('/animals/<int:animal_id>/photo/status', methods=['GET'])
+def get_photo_status(animal_id):
+    """Get an animal's photo processing status
+
+    Pass wait=<seconds> to long-poll until the photo is no longer pending.
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    from flask import current_app
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), current_app.config['PHOTO_STATUS_MAX_WAIT'])
+    except ValueError:
+        return jsonify({'error': 'Invalid wait'}), 400
+    deadline = time.monotonic() + wait
+    
+    while True:
+        animal = Animal.query.filter_by(id=animal_id, user_id=user_id).first()
+        if not animal:
+            return jsonify({'error': 'Animal not found'}), 404
+        if animal.photo_status != 'pending' or time.monotonic() >= deadline:
+            break
+        db.session.rollback()
+        time.sleep(0.25)
+    
+    return jsonify({
+        'photo_status': animal.photo_status,
+        'photo_path': animal.photo_path
+    }), 200
+
+def _stage_photo_data(photo_data):
+    """Stage a base64 photoData payload, returns its temporary path"""
+    from flask import current_app
+    if not reserve_photo_slot(current_app):
+        raise OperationError(PHOTO_QUEUE_FULL, 503, {'Retry-After': '5'})
+    with metrics.timer('photo_stage'):
+        staged_photo = stage_base64_upload(photo_data)
+    if not staged_photo:
+        release_photo_slot(current_app)
+        raise OperationError('Invalid image')
+    return staged_photo
+
+def _discard_staged_photo(staged_photo):
+    """Undo _stage_photo_data when the animal could not be saved"""
+    if staged_photo:
+        from flask import current_app
+        delete_file(staged_photo)
+        release_photo_slot(current_app)
+
+@contextmanager
+def _discarding(staged_photo):
+    """Discard a staged photo if the block raises, as its caller never sees it"""
+    try:
+        yield
+    except Exception:
+        _discard_staged_photo(staged_photo)
+        raise
+
+def _submit_photo(animal, staged_photo):
+    from flask import current_app
+    submit_photo_job(current_app._get_current_object(), animal.id, staged_photo)
+
+def _photo_queue_full():
+    response = jsonify({'error': PHOTO_QUEUE_FULL})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
 # File serving route
 @api.route('/uploads/<filename>')
 def serve_upload(filename):
-    """Serve uploaded files"""
+    """Serve uploaded files
+
+    ?size=thumb|card|full picks a photo derivative. WebP is sent instead of
+    JPEG when the client accepts it and a WebP copy exists. Responses carry
+    strong ETags and honour If-None-Match, If-Modified-Since and Range.
+    With UPLOAD_SENDFILE set, the front server sends the bytes instead.
+    """
     from flask import current_app
-    return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
\ No newline at end of file
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    
+    size = request.args.get('size', 'full')
+    if size not in PHOTO_SIZES:
+        return jsonify({'error': 'Invalid size'}), 400
+    
+    private = current_app.config['UPLOADS_REQUIRE_AUTH']
+    if private:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'Not authenticated'}), 401
+        if not Animal.query.filter_by(user_id=user_id, photo_path=filename).first():
+            return jsonify({'error': 'File not found'}), 404
+    
+    served = filename
+    if filename.endswith('.jpg'):
+        candidates = [photo_variant(filename, size)]
+        if request.accept_mimetypes['image/webp']:
+            candidates.insert(0, photo_variant(filename, size, 'webp'))
+        # Photos stored before derivatives existed only have the original
+        for candidate in candidates:
+            if os.path.isfile(os.path.join(upload_folder, candidate)):
+                served = candidate
+                break
+    
+    # Named by content hash, so the bytes behind a name never change
+    immutable = is_content_addressed(served)
+    etag = served if immutable else None
+    
+    if current_app.config['UPLOAD_SENDFILE'] == 'x-accel':
+        response = _accel_redirect(upload_folder, served, etag)
+    elif immutable:
+        response = send_from_directory(upload_folder, served, etag=etag, max_age=31536000)
+    else:
+        response = send_from_directory(upload_folder, served)
+    
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+        if private:
+            response.cache_control.public = False
+            response.cache_control.private = True
+        else:
+            response.cache_control.public = True
+    if response.status_code == 200:
+        response.accept_ranges = 'bytes'
+    response.vary.add('Accept')
+    return response
+
+def _accel_redirect(upload_folder, filename, etag=None):
+    """Hand an upload to nginx through X-Accel-Redirect
+
+    Only validators are computed here; nginx answers Range requests from
+    the internal location named by UPLOAD_ACCEL_PREFIX.
+    """
+    from flask import current_app, abort
+    path = safe_join(upload_folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    
+    stat = os.stat(path)
+    response = current_app.response_class(
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    )
+    response.headers['X-Accel-Redirect'] = current_app.config['UPLOAD_ACCEL_PREFIX'] + filename
+    response.last_modified = stat.st_mtime
+    response.set_etag(etag or f"{stat.st_mtime}-{stat.st_size}-{adler32(path.encode('utf-8')) & 0xFFFFFFFF}")
+    response.cache_control.no_cache = True
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        response.headers.pop('X-Accel-Redirect', None)
+    return response
@@ -0,0 +1,63 @@
+import re
+from sqlalchemy import text
+from models import db
+
+# Full-text index over animal names, notes, calf details and injection
+# details. It lives outside the models: migration 0004 creates an FTS5
+# table on SQLite or a tsvector table with a GIN index on PostgreSQL,
+# plus triggers that keep it in sync with every write to animals and
+# injections, including bulk inserts that bypass the ORM.
+
+SEARCH_TABLE = 'animal_search'
+MAX_TERMS = 8
+
+_QUERIES = {
+    # bm25 column weights: user_id, name, notes, calf_details, injections
+    'sqlite': """
+        SELECT id, score FROM (
+            SELECT rowid AS id, bm25(animal_search, 0.0, 10.0, 2.0, 2.0, 1.0) AS score
+            FROM animal_search
+            WHERE animal_search MATCH :query AND user_id = :user_id
+        ) AS ranked
+    """,
+    # float8 so the score survives the round trip through a cursor exactly
+    'postgresql': """
+        SELECT id, score FROM (
+            SELECT animal_id AS id, -ts_rank_cd(document, query)::float8 AS score
+            FROM animal_search, to_tsquery('english', :query) AS query
+            WHERE user_id = :user_id AND document @@ query
+        ) AS ranked
+    """
+}
+
+def is_search_table(name):
+    """True for the search index and FTS5's shadow tables"""
+    return name == SEARCH_TABLE or name.startswith(SEARCH_TABLE + '_')
+
+def search_supported():
+    return db.engine.dialect.name in _QUERIES
+
+def search_terms(query):
+    """Words of a user query, stripped of any search syntax"""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+def search_animals(user_id, terms, limit, after=None):
+    """Ids and scores of matching animals, best match first
+
+    Every term must match, as a word prefix. Lower scores rank higher, and
+    after=(score, id) continues from the last row of the previous page.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        query = ' '.join(f'"{term}"*' for term in terms)
+    else:
+        query = ' & '.join(f'{term}:*' for term in terms)
+
+    sql = _QUERIES[dialect]
+    params = {'query': query, 'user_id': user_id, 'limit': limit}
+    if after:
+        sql += ' WHERE score > :score OR (score = :score AND id > :id)'
+        params['score'], params['id'] = after
+    sql += ' ORDER BY score, id LIMIT :limit'
+
+    return [(row.id, row.score) for row in db.session.execute(text(sql), params)]
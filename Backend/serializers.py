@@ -0,0 +1,148 @@
+import json
+from datetime import date, datetime
+from flask import has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+from metrics import timer
+from models import db, Animal, Injection
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is used without it
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional, clients always get JSON without it
+    msgpack = None
+
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
+# List endpoints read the columns they return straight from a Core SELECT
+# into plain dicts, skipping ORM instances and to_dict(). Dates stay date
+# objects until the JSON encoder writes them, which orjson does natively.
+
+# Output field name -> column, in Animal.to_dict() order
+ANIMAL_SCHEMA = {
+    'id': Animal.id,
+    'name': Animal.name,
+    'animal_type': Animal.animal_type,
+    'photo_path': Animal.photo_path,
+    'photo_status': Animal.photo_status,
+    'inseminated_date': Animal.inseminated_date,
+    'delivery_date': Animal.delivery_date,
+    'calf_details': Animal.calf_details,
+    'notes': Animal.notes,
+    'created_at': Animal.created_at,
+    'updated_at': Animal.updated_at
+}
+
+INJECTION_SCHEMA = {
+    'id': Injection.id,
+    'date': Injection.date,
+    'details': Injection.details
+}
+
+INJECTION_CHUNK = 500
+
+def animal_select(fields=None):
+    """SELECT of the given output fields (all by default), id always included"""
+    names = [name for name in ANIMAL_SCHEMA if not fields or name in fields or name == 'id']
+    return select(*[ANIMAL_SCHEMA[name].label(name) for name in names])
+
+def fetch_animals(statement, include_injections=False):
+    """Run an animal_select() statement, returns the rows as dicts"""
+    with timer('animal_rows'):
+        animals = [dict(row) for row in db.session.execute(statement).mappings()]
+        if include_injections:
+            attach_injections(animals)
+    return animals
+
+def attach_injections(animals):
+    """Add an 'injections' list to each animal dict, one query per chunk"""
+    by_id = {}
+    for animal in animals:
+        animal['injections'] = []
+        by_id[animal['id']] = animal
+
+    animal_ids = list(by_id)
+    columns = [column.label(name) for name, column in INJECTION_SCHEMA.items()]
+    for start in range(0, len(animal_ids), INJECTION_CHUNK):
+        rows = db.session.execute(
+            select(Injection.animal_id, *columns)
+            .where(Injection.animal_id.in_(animal_ids[start:start + INJECTION_CHUNK]))
+            .order_by(Injection.animal_id, Injection.id)
+        )
+        for animal_id, *values in rows:
+            by_id[animal_id]['injections'].append(dict(zip(INJECTION_SCHEMA, values)))
+
+def _default(obj):
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    return DefaultJSONProvider.default(obj)
+
+def dumps(obj):
+    """Encode to a JSON string with the fastest available encoder"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, default=_default, separators=(',', ':'))
+
+def _msgpack_mimetype():
+    """The MessagePack type the client asked for, if it prefers one to JSON"""
+    if msgpack is None or not has_request_context():
+        return None
+    best = request.accept_mimetypes.best_match(('application/json',) + MSGPACK_MIMETYPES)
+    return best if best in MSGPACK_MIMETYPES else None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson when it is installed
+
+    Dates and datetimes are written in ISO 8601 with either encoder, the
+    format the API has always used. Keys are not sorted. Clients that
+    prefer application/msgpack in Accept get the same document as
+    MessagePack when msgpack is installed.
+    """
+
+    sort_keys = False
+    ensure_ascii = False
+    default = staticmethod(_default)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        return self._orjson_dumps(obj, **kwargs).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        with timer('json_encode'):
+            return self._response(*args, **kwargs)
+
+    def _response(self, *args, **kwargs):
+        mimetype = _msgpack_mimetype()
+        if mimetype is not None:
+            obj = self._prepare_response_obj(args, kwargs)
+            body = msgpack.packb(obj, default=_default, use_bin_type=True)
+            response = self._app.response_class(body, mimetype=mimetype)
+        elif orjson is None:
+            response = super().response(*args, **kwargs)
+        else:
+            obj = self._prepare_response_obj(args, kwargs)
+            indent = (self.compact is None and self._app.debug) or self.compact is False
+            body = self._orjson_dumps(obj, indent=2 if indent else None)
+            response = self._app.response_class(body + b'\n', mimetype=self.mimetype)
+        if msgpack is not None:
+            response.vary.add('Accept')
+        return response
+
+    def _orjson_dumps(self, obj, indent=None, sort_keys=None, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if self.sort_keys if sort_keys is None else sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option)
@@ -0,0 +1,152 @@
+from datetime import date, timedelta
+from sqlalchemy import and_, case, delete, event, func, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from models import db, Animal, Injection, HerdStat, UpcomingEvent
+
+# Herd counts per user and animal type live in herd_stats. Every flush
+# that adds, removes or changes an animal adjusts them in the same
+# transaction, so the dashboard reads a handful of rows whatever the herd
+# size. Bulk inserts that bypass the ORM call count_new_animals.
+
+COUNTED_ATTRIBUTES = ('user_id', 'animal_type', 'inseminated_date', 'delivery_date')
+
+_UPSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+def is_pregnant(inseminated_date, delivery_date):
+    """Inseminated, and no delivery recorded since"""
+    return bool(inseminated_date) and not (delivery_date and delivery_date >= inseminated_date)
+
+# SQL version of is_pregnant, for recounting
+PREGNANT = case(
+    (and_(
+        Animal.inseminated_date.isnot(None),
+        or_(Animal.delivery_date.is_(None), Animal.delivery_date < Animal.inseminated_date)
+    ), 1),
+    else_=0
+)
+
+# Load the old value before these change so a flush can tell what moved
+for _name in COUNTED_ATTRIBUTES:
+    event.listen(getattr(Animal, _name), 'set', lambda target, value, oldvalue, initiator: None, active_history=True)
+
+@event.listens_for(Session, 'after_flush')
+def _count_changes(session, flush_context):
+    deltas = {}
+    for animal in session.new:
+        if isinstance(animal, Animal):
+            _add(deltas, _values(animal, 'added'), 1)
+    for animal in session.deleted:
+        if isinstance(animal, Animal):
+            _add(deltas, _values(animal, 'deleted'), -1)
+    for animal in session.dirty:
+        if isinstance(animal, Animal) and _counted_change(animal):
+            _add(deltas, _values(animal, 'deleted'), -1)
+            _add(deltas, _values(animal, 'added'), 1)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+def _counted_change(animal):
+    state = db.inspect(animal)
+    return any(state.attrs[name].history.has_changes() for name in COUNTED_ATTRIBUTES)
+
+def _values(animal, side):
+    """The counted attributes before ('deleted') or after ('added') the flush"""
+    state = db.inspect(animal)
+    values = []
+    for name in COUNTED_ATTRIBUTES:
+        history = state.attrs[name].history
+        changed = getattr(history, side)
+        values.append(changed[0] if changed else (history.unchanged[0] if history.unchanged else None))
+    return values
+
+def _add(deltas, values, sign):
+    user_id, animal_type, inseminated_date, delivery_date = values
+    total, pregnant = deltas.get((user_id, animal_type), (0, 0))
+    deltas[(user_id, animal_type)] = (
+        total + sign,
+        pregnant + (sign if is_pregnant(inseminated_date, delivery_date) else 0)
+    )
+
+def count_new_animals(session, rows):
+    """Count animals inserted as plain row dicts"""
+    deltas = {}
+    for row in rows:
+        _add(deltas, [row['user_id'], row['animal_type'], row.get('inseminated_date'), row.get('delivery_date')], 1)
+    apply_deltas(session.connection(), deltas)
+
+def apply_deltas(connection, deltas):
+    """Add {(user_id, animal_type): (total, pregnant)} to the counters"""
+    table = HerdStat.__table__
+    upsert = _UPSERTS.get(connection.dialect.name)
+    for (user_id, animal_type), (total, pregnant) in deltas.items():
+        if not total and not pregnant:
+            continue
+        if upsert is not None:
+            statement = upsert(table).values(user_id=user_id, animal_type=animal_type, total=total, pregnant=pregnant)
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=['user_id', 'animal_type'],
+                set_={
+                    'total': table.c.total + statement.excluded.total,
+                    'pregnant': table.c.pregnant + statement.excluded.pregnant
+                }
+            ))
+            continue
+        result = connection.execute(
+            update(table)
+            .where(table.c.user_id == user_id, table.c.animal_type == animal_type)
+            .values(total=table.c.total + total, pregnant=table.c.pregnant + pregnant)
+        )
+        if not result.rowcount:
+            connection.execute(insert(table).values(user_id=user_id, animal_type=animal_type, total=total, pregnant=pregnant))
+
+def recount(user_id=None):
+    """Rebuild the counters from the animals table (one user, or everyone)"""
+    table = HerdStat.__table__
+    wipe = delete(table)
+    counts = select(Animal.user_id, Animal.animal_type, func.count(), func.sum(PREGNANT)).group_by(Animal.user_id, Animal.animal_type)
+    if user_id is not None:
+        wipe = wipe.where(table.c.user_id == user_id)
+        counts = counts.where(Animal.user_id == user_id)
+    connection = db.session.connection()
+    connection.execute(wipe)
+    connection.execute(insert(table).from_select(['user_id', 'animal_type', 'total', 'pregnant'], counts))
+
+def herd_stats(user_id, days=30):
+    """Dashboard numbers for one user, looking back and ahead `days` days"""
+    today = date.today()
+    counts = db.session.execute(
+        select(HerdStat.animal_type, HerdStat.total, HerdStat.pregnant)
+        .where(HerdStat.user_id == user_id, HerdStat.total > 0)
+        .order_by(HerdStat.animal_type)
+    ).all()
+
+    deliveries_due = db.session.scalar(
+        select(func.count()).select_from(UpcomingEvent).where(
+            UpcomingEvent.user_id == user_id,
+            UpcomingEvent.kind == 'expected_delivery',
+            UpcomingEvent.due_date >= today,
+            UpcomingEvent.due_date <= today + timedelta(days=days)
+        )
+    )
+
+    recent = db.session.execute(
+        select(Injection.details, func.count().label('count'))
+        .join(Animal, Animal.id == Injection.animal_id)
+        .where(Animal.user_id == user_id, Injection.date >= today - timedelta(days=days), Injection.date <= today)
+        .group_by(Injection.details)
+        .order_by(func.count().desc(), Injection.details)
+    ).all()
+
+    return {
+        'total': sum(row.total for row in counts),
+        'by_type': {row.animal_type: row.total for row in counts},
+        'pregnant': sum(row.pregnant for row in counts),
+        'pregnant_by_type': {row.animal_type: row.pregnant for row in counts if row.pregnant},
+        'deliveries_due': deliveries_due,
+        'recent_injections': {
+            'days': days,
+            'total': sum(row.count for row in recent),
+            'by_details': [{'details': row.details, 'count': row.count} for row in recent]
+        }
+    }
@@ -0,0 +1,100 @@
+from conftest import create_animal, register
+
+
+def test_requires_login(client):
+    assert client.get('/api/animals').status_code == 401
+    assert client.post('/api/animals', json={'name': 'Bella', 'type': 'Cow'}).status_code == 401
+
+
+def test_create_update_delete(client, user):
+    animal = create_animal(
+        client, name='Bella', type='Cow', notes='Calm', inseminatedDate='2026-01-10',
+        injections=[{'date': '2026-02-01', 'details': 'FMD vaccine'}]
+    )
+    assert animal['animal_type'] == 'Cow'
+    assert animal['inseminated_date'] == '2026-01-10'
+    assert [inj['details'] for inj in animal['injections']] == ['FMD vaccine']
+
+    injection_id = animal['injections'][0]['id']
+    response = client.put(f"/api/animals/{animal['id']}", json={
+        'notes': 'Limping',
+        'injections': [
+            {'id': injection_id, 'date': '2026-02-01', 'details': 'FMD booster'},
+            {'date': '2026-03-01', 'details': 'Deworming'}
+        ]
+    })
+    assert response.status_code == 200
+    updated = response.get_json()['animal']
+    assert updated['notes'] == 'Limping'
+    assert sorted(inj['details'] for inj in updated['injections']) == ['Deworming', 'FMD booster']
+    assert injection_id in [inj['id'] for inj in updated['injections']]
+
+    assert client.delete(f"/api/animals/{animal['id']}").status_code == 200
+    assert client.delete(f"/api/animals/{animal['id']}").status_code == 404
+    assert client.get('/api/animals').get_json()['animals'] == []
+
+
+def test_create_missing_fields(client, user):
+    response = client.post('/api/animals', json={'name': 'Nameless'})
+    assert response.status_code == 400
+
+
+def test_other_users_animals_are_hidden(app, client, user):
+    animal = create_animal(client)
+    other = app.test_client()
+    register(other)
+    assert other.get('/api/animals').get_json()['animals'] == []
+    assert other.put(f"/api/animals/{animal['id']}", json={'notes': 'x'}).status_code == 404
+    assert other.delete(f"/api/animals/{animal['id']}").status_code == 404
+
+
+def test_listing_pages(client, user):
+    ids = [create_animal(client, name=f'Cow {i}')['id'] for i in range(5)]
+
+    seen, cursor = [], None
+    while True:
+        response = client.get('/api/animals', query_string={'limit': 2, 'cursor': cursor or ''})
+        assert response.status_code == 200
+        page = response.get_json()
+        seen += [animal['id'] for animal in page['animals']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert seen == list(reversed(ids))
+
+    page = client.get('/api/animals', query_string={'fields': 'name', 'limit': 1}).get_json()
+    assert set(page['animals'][0]) == {'id', 'name'}
+
+
+def test_listing_etag(client, user):
+    create_animal(client)
+    response = client.get('/api/animals')
+    etag = response.headers['ETag']
+    assert client.get('/api/animals', headers={'If-None-Match': etag}).status_code == 304
+
+    create_animal(client, name='Daisy')
+    response = client.get('/api/animals', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.get_json()['animals']) == 2
+
+
+def test_injection_routes(client, user):
+    animal = create_animal(client)
+    response = client.post(f"/api/animals/{animal['id']}/injections", json={'date': '2026-04-01', 'details': 'HS vaccine'})
+    assert response.status_code == 201
+    injection_id = response.get_json()['injection']['id']
+
+    response = client.patch(f"/api/animals/{animal['id']}/injections/{injection_id}", json={'details': 'HS booster'})
+    assert response.status_code == 200
+    assert response.get_json()['injection']['details'] == 'HS booster'
+
+    assert client.delete(f"/api/animals/{animal['id']}/injections/{injection_id}").status_code == 200
+    assert client.delete(f"/api/animals/{animal['id']}/injections/{injection_id}").status_code == 404
+
+
+def test_cors_preflight_allows_patch(client):
+    response = client.options('/api/animals/1/injections/1', headers={
+        'Origin': 'http://localhost:3000',
+        'Access-Control-Request-Method': 'PATCH'
+    })
+    assert 'PATCH' in response.headers['Access-Control-Allow-Methods']
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+
+from conftest import register
+from models import db, VerificationCode
+
+
+def test_register_verify_login(client):
+    user = register(client)
+    assert user['is_verified']
+    assert client.get('/api/current-user').get_json()['user']['id'] == user['id']
+
+    assert client.post('/api/logout').status_code == 200
+    assert client.get('/api/current-user').status_code == 401
+
+    response = client.post('/api/login', json={'email': user['email'], 'password': 'secret123'})
+    assert response.status_code == 200
+    assert client.get('/api/current-user').status_code == 200
+
+
+def test_login_rejects_bad_password_and_unverified(client):
+    user = register(client)
+    response = client.post('/api/login', json={'email': user['email'], 'password': 'wrong'})
+    assert response.status_code == 401
+
+    response = client.post('/api/register', json={'email': 'pending@example.com', 'password': 'pw', 'name': 'P'})
+    assert response.status_code == 201
+    response = client.post('/api/login', json={'email': 'pending@example.com', 'password': 'pw'})
+    assert response.status_code == 403
+    assert response.get_json()['requires_verification']
+
+
+def test_register_duplicate_email(client):
+    user = register(client)
+    response = client.post('/api/register', json={'email': user['email'], 'password': 'pw', 'name': 'Again'})
+    assert response.status_code == 400
+
+
+def _pending_user(client, email):
+    response = client.post('/api/register', json={'email': email, 'password': 'pw', 'name': 'P'})
+    return response.get_json()['user_id']
+
+
+def test_verification_code_expires(app, client):
+    user_id = _pending_user(client, 'late@example.com')
+    with app.app_context():
+        row = db.session.get(VerificationCode, user_id)
+        code = row.code
+        row.expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+
+    response = client.post('/api/verify', json={'user_id': user_id, 'code': code})
+    assert response.status_code == 400
+    assert 'expired' in response.get_json()['error']
+
+
+def test_verification_code_wrong_guesses(app, client):
+    user_id = _pending_user(client, 'guesser@example.com')
+    with app.app_context():
+        code = db.session.get(VerificationCode, user_id).code
+    wrong = '000000' if code != '000000' else '111111'
+
+    for _ in range(app.config['VERIFICATION_MAX_ATTEMPTS']):
+        assert client.post('/api/verify', json={'user_id': user_id, 'code': wrong}).status_code == 400
+    # Used up: even the right code fails now
+    assert client.post('/api/verify', json={'user_id': user_id, 'code': code}).status_code == 400
+
+    assert client.post('/api/resend-code', json={'user_id': user_id}).status_code == 200
+    with app.app_context():
+        code = db.session.get(VerificationCode, user_id).code
+    assert client.post('/api/verify', json={'user_id': user_id, 'code': code}).status_code == 200
+
+
+def test_non_ascii_code_counts_as_a_wrong_guess(app, client):
+    user_id = _pending_user(client, 'fullwidth@example.com')
+    response = client.post('/api/verify', json={'user_id': user_id, 'code': '\uff11\uff12\uff13\uff14\uff15\uff16'})
+    assert response.status_code == 400
+    with app.app_context():
+        assert db.session.get(VerificationCode, user_id).attempts == 1
+
+
+def test_login_rate_limit(app, client, monkeypatch):
+    user = register(client)
+    monkeypatch.setitem(app.config, 'RATELIMIT_ENABLED', True)
+    monkeypatch.setitem(app.config, 'RATELIMITS', {'login': {'ip': (100, 60), 'account': (2, 300)}})
+
+    for _ in range(2):
+        response = client.post('/api/login', json={'email': user['email'], 'password': 'wrong'},
+                               environ_base={'REMOTE_ADDR': '198.51.100.7'})
+        assert response.status_code == 401
+    response = client.post('/api/login', json={'email': user['email'], 'password': 'secret123'},
+                           environ_base={'REMOTE_ADDR': '198.51.100.7'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+
+
+def test_register_and_verify_rate_limits(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'RATELIMIT_ENABLED', True)
+    monkeypatch.setitem(app.config, 'RATELIMITS', {'register': {'ip': (1, 3600)}, 'verify': {'ip': (100, 600), 'account': (1, 600)}})
+    ip = {'REMOTE_ADDR': '198.51.100.8'}
+
+    response = client.post('/api/register', json={'email': 'limited@example.com', 'password': 'pw', 'name': 'L'}, environ_base=ip)
+    assert response.status_code == 201
+    user_id = response.get_json()['user_id']
+    response = client.post('/api/register', json={'email': 'limited2@example.com', 'password': 'pw', 'name': 'L'}, environ_base=ip)
+    assert response.status_code == 429
+    # Refused before any database work
+    assert client.post('/api/login', json={'email': 'limited2@example.com', 'password': 'pw'}).status_code == 401
+
+    assert client.post('/api/verify', json={'user_id': user_id, 'code': 'nope'}, environ_base=ip).status_code == 400
+    with app.app_context():
+        code = db.session.get(VerificationCode, user_id).code
+    # The account's bucket is empty, even for the right code from another IP
+    response = client.post('/api/verify', json={'user_id': user_id, 'code': code}, environ_base={'REMOTE_ADDR': '198.51.100.9'})
+    assert response.status_code == 429
@@ -0,0 +1,62 @@
+import gzip
+import json
+
+import brotli
+import msgpack
+
+from conftest import create_animal, make_photo
+
+
+def _herd(client, count=20):
+    for i in range(count):
+        create_animal(client, name=f'Cow {i}', notes='Grazes in the north paddock')
+
+
+def test_gzip_and_brotli(client, user):
+    _herd(client)
+    plain = client.get('/api/animals')
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.vary
+
+    response = client.get('/api/animals', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(response.get_data())) == plain.get_json()
+
+    response = client.get('/api/animals', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert json.loads(brotli.decompress(response.get_data())) == plain.get_json()
+    assert int(response.headers['Content-Length']) < len(plain.get_data())
+
+
+def test_small_responses_and_photos_are_not_compressed(client, user):
+    animal = create_animal(client)
+    response = client.get('/api/current-user', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+
+    client.put(f"/api/animals/{animal['id']}/photo", data=make_photo(440, 300), content_type='image/jpeg')
+    photo_path = client.get(f"/api/animals/{animal['id']}/photo/status").get_json()['photo_path']
+    response = client.get(f'/api/uploads/{photo_path}', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.accept_ranges == 'bytes'
+
+
+def test_streamed_export_is_compressed(client, user):
+    _herd(client)
+    plain = client.get('/api/animals/export').get_data()
+    response = client.get('/api/animals/export', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()) == plain
+
+
+def test_msgpack_negotiation(client, user):
+    _herd(client, 3)
+    plain = client.get('/api/animals').get_json()
+    response = client.get('/api/animals', headers={'Accept': 'application/msgpack'})
+    assert response.mimetype == 'application/msgpack'
+    assert 'Accept' in response.vary
+    assert msgpack.unpackb(response.get_data()) == plain
+
+    # JSON stays the default when both are acceptable
+    response = client.get('/api/animals', headers={'Accept': 'application/json, application/msgpack'})
+    assert response.mimetype == 'application/json'
@@ -0,0 +1,42 @@
+from flask import g
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+import metrics
+from conftest import create_animal
+from models import db
+
+
+def test_metrics_endpoint(app, client, user, monkeypatch):
+    create_animal(client)
+    response = client.get('/api/animals')
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('db;dur=') and 'queries' in timing
+
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'naam_http_request_duration_seconds_count{method="GET",route="/api/animals",status="200"}' in body
+    assert 'naam_http_request_sql_queries_bucket{method="POST",route="/api/animals",le="+Inf"}' in body
+
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'sekrit')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer sekrit'}).status_code == 200
+
+
+def test_failed_statements_are_counted(app):
+    with app.test_request_context('/'):
+        metrics._start_request()
+        for statement in ['SELECT * FROM no_such_table'] * 3 + ['SELECT 1']:
+            connection = db.session.connection()
+            before = g.naam_queries
+            try:
+                connection.execute(text(statement))
+            except DBAPIError:
+                db.session.rollback()
+            assert g.naam_queries == before + 1
+        db.session.rollback()
+
+
+def test_section_timer():
+    with metrics.timer('test_section'):
+        pass
+    assert 'naam_section_duration_seconds_count{section="test_section"} 1' in metrics.render()
@@ -0,0 +1,142 @@
+"""The migration chain, run through 'flask db' as a deploy would
+
+Runs on a scratch database next to TEST_DATABASE_URL (a second SQLite
+file, or a <name>_migrations database on the same PostgreSQL server).
+Data is added at 0004 so the later data migrations have rows to carry.
+"""
+import os
+import subprocess
+import sys
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import make_url
+
+from conftest import BACKEND_DIR, TEMP_DIR
+
+REVISIONS = ['0001', '0002', '0003', '0004', '0005', '0006', '0007', '0008', '0009']
+
+
+@pytest.fixture(scope='module')
+def scratch(app):
+    """(url for DATABASE_URL, engine) of an empty scratch database"""
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        url = url.set(database=os.path.join(TEMP_DIR, 'migrations.db'))
+    else:
+        url = url.set(database=f'{url.database}_migrations')
+        admin = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], isolation_level='AUTOCOMMIT')
+        with admin.connect() as conn:
+            conn.execute(text(f'DROP DATABASE IF EXISTS "{url.database}"'))
+            conn.execute(text(f'CREATE DATABASE "{url.database}"'))
+        admin.dispose()
+
+    engine = create_engine(url)
+    yield url.render_as_string(hide_password=False), engine
+    engine.dispose()
+
+
+def flask_db(scratch, *args):
+    """Run a 'flask db' command against the scratch database"""
+    env = dict(os.environ, DATABASE_URL=scratch[0], AUTO_MIGRATE='0')
+    result = subprocess.run(
+        [sys.executable, '-m', 'flask', '--app', 'app', 'db', *args],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    return result
+
+
+def _tables(engine):
+    return set(inspect(engine).get_table_names())
+
+
+def _columns(engine, table):
+    return {column['name'] for column in inspect(engine).get_columns(table)}
+
+
+def _seed(engine):
+    """Rows in the 0004 schema: two users, one with a pending code"""
+    today = date.today()
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(text(
+            'INSERT INTO users (id, email, password_hash, name, verification_code, is_verified, created_at) '
+            'VALUES (:id, :email, :hash, :name, :code, :verified, :now)'
+        ), [
+            {'id': 1, 'email': 'done@example.com', 'hash': 'x', 'name': 'Done', 'code': '111111', 'verified': True, 'now': now},
+            {'id': 2, 'email': 'pending@example.com', 'hash': 'x', 'name': 'Pending', 'code': '222222', 'verified': False, 'now': now}
+        ])
+        conn.execute(text(
+            'INSERT INTO animals (id, user_id, name, animal_type, inseminated_date, notes, created_at, updated_at) '
+            'VALUES (:id, 1, :name, :type, :inseminated, :notes, :now, :now)'
+        ), [
+            {'id': 1, 'name': 'Bella', 'type': 'Cow', 'inseminated': today - timedelta(days=100), 'notes': 'Calm', 'now': now},
+            {'id': 2, 'name': 'Gauri', 'type': 'Goat', 'inseminated': None, 'notes': None, 'now': now},
+            {'id': 3, 'name': 'Chhoti', 'type': 'Goat', 'inseminated': None, 'notes': None, 'now': now}
+        ])
+        conn.execute(text(
+            'INSERT INTO injections (animal_id, date, details, created_at) VALUES (:animal_id, :date, :details, :now)'
+        ), [
+            {'animal_id': 2, 'date': today - timedelta(days=10), 'details': 'FMD vaccine', 'now': now},
+            {'animal_id': 2, 'date': today - timedelta(days=5), 'details': 'Vitamin shot', 'now': now}
+        ])
+        if engine.dialect.name == 'postgresql':
+            conn.execute(text("SELECT setval('users_id_seq', 2)"))
+            conn.execute(text("SELECT setval('animals_id_seq', 3)"))
+
+
+def test_upgrade_carries_data(scratch):
+    engine = scratch[1]
+    for revision in REVISIONS[:4]:
+        flask_db(scratch, 'upgrade', revision)
+    assert {'users', 'animals', 'injections', 'idempotency_keys', 'animal_search'} <= _tables(engine)
+
+    _seed(engine)
+    with engine.connect() as conn:
+        # Filled by the 0004 triggers
+        assert conn.scalar(text('SELECT count(*) FROM animal_search')) == 3
+
+    flask_db(scratch, 'upgrade', '0005')
+    with engine.connect() as conn:
+        events = conn.execute(text('SELECT animal_id, kind, label FROM upcoming_events ORDER BY animal_id')).all()
+    assert [tuple(event) for event in events] == [(1, 'expected_delivery', None), (2, 'booster', 'FMD')]
+
+    flask_db(scratch, 'upgrade', '0006')
+    with engine.connect() as conn:
+        stats = conn.execute(text('SELECT animal_type, total, pregnant FROM herd_stats WHERE user_id = 1 ORDER BY animal_type')).all()
+    assert [tuple(row) for row in stats] == [('Cow', 1, 1), ('Goat', 2, 0)]
+
+    flask_db(scratch, 'upgrade', '0007')
+    assert 'data_version' in _columns(engine, 'users')
+
+    flask_db(scratch, 'upgrade', '0008')
+    assert 'verification_code' not in _columns(engine, 'users')
+    with engine.connect() as conn:
+        codes = conn.execute(text('SELECT user_id, code, attempts FROM verification_codes')).all()
+    # Only the unverified user's code is carried over
+    assert [tuple(row) for row in codes] == [(2, '222222', 0)]
+
+    flask_db(scratch, 'upgrade', '0009')
+    assert 'change_version' in _columns(engine, 'animals')
+    assert 'change_version' in _columns(engine, 'animal_tombstones')
+    assert 'ix_animals_user_change' in {index['name'] for index in inspect(engine).get_indexes('animals')}
+
+    # The migrated schema matches models.py
+    assert 'No new upgrade operations detected' in flask_db(scratch, 'check').stdout
+
+    # Search triggers survive the batch table rebuilds of later migrations
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE animals SET notes = 'Limping' WHERE id = 3"))
+        conn.execute(text('DELETE FROM animals WHERE id = 1'))
+        assert conn.scalar(text('SELECT count(*) FROM animal_search')) == 2
+
+
+def test_downgrade_and_upgrade_again(scratch):
+    flask_db(scratch, 'upgrade', 'head')
+    flask_db(scratch, 'downgrade', 'base')
+    assert _tables(scratch[1]) <= {'alembic_version'}
+
+    flask_db(scratch, 'upgrade', 'head')
+    assert {'users', 'animals', 'upcoming_events', 'herd_stats', 'verification_codes'} <= _tables(scratch[1])
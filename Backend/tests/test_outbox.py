@@ -0,0 +1,70 @@
+import json
+from datetime import datetime
+
+from models import db, OutboxMessage
+from outbox import drain_outbox, FileBackend
+
+
+class FailingBackend:
+    def send(self, message):
+        raise ConnectionError('SMTP server unavailable')
+
+    def close(self):
+        pass
+
+
+def _register(client, email):
+    response = client.post('/api/register', json={'email': email, 'password': 'pw', 'name': 'P'})
+    assert response.status_code == 201
+
+
+def _message(app, recipient):
+    with app.app_context():
+        message = OutboxMessage.query.filter_by(recipient=recipient).one()
+        db.session.expunge(message)
+        return message
+
+
+def _sent(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_register_queues_email_until_sent(app, client):
+    _register(client, 'queued@example.com')
+    # Queued with the user, not sent from the request
+    assert _message(app, 'queued@example.com').status == 'pending'
+
+    result = app.test_cli_runner().invoke(args=['send-outbox'])
+    assert result.exit_code == 0, result.output
+    message = _message(app, 'queued@example.com')
+    assert message.status == 'sent'
+    assert message.attempts == 1
+
+    sent, = [line for line in _sent(app.config['OUTBOX_FILE']) if line['recipient'] == 'queued@example.com']
+    assert sent['subject'] == 'NAAM - Your Verification Code'
+    assert message.body == sent['body']
+    assert drain_outbox(app, FileBackend(app.config['OUTBOX_FILE'])) == 0
+
+
+def test_failed_send_is_retried(app, client, monkeypatch, tmp_path):
+    # Leave only this test's message due
+    earlier = FileBackend(str(tmp_path / 'earlier.jsonl'))
+    while drain_outbox(app, earlier):
+        pass
+    monkeypatch.setitem(app.config, 'OUTBOX_MAX_ATTEMPTS', 2)
+    _register(client, 'retry@example.com')
+
+    assert drain_outbox(app, FailingBackend()) == 1
+    message = _message(app, 'retry@example.com')
+    assert (message.status, message.attempts) == ('pending', 1)
+    assert message.last_error == 'SMTP server unavailable'
+    assert message.next_attempt_at > datetime.utcnow()
+    # Not due again until the backoff has passed
+    assert drain_outbox(app, FailingBackend()) == 0
+
+    with app.app_context():
+        db.session.get(OutboxMessage, message.id).next_attempt_at = datetime.utcnow()
+        db.session.commit()
+    assert drain_outbox(app, FailingBackend()) == 1
+    assert _message(app, 'retry@example.com').status == 'failed'
@@ -0,0 +1,167 @@
+import hashlib
+import io
+import os
+
+import jobs
+from conftest import create_animal, make_photo
+from models import db, Photo
+from utils import PHOTO_SIZES, photo_variant
+
+
+def _upload(client, animal_id, photo=None, content_type='image/jpeg'):
+    return client.put(f'/api/animals/{animal_id}/photo', data=photo or make_photo(), content_type=content_type)
+
+
+def _status(client, animal_id, wait=0):
+    response = client.get(f'/api/animals/{animal_id}/photo/status', query_string={'wait': wait})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_photo_job_in_process_pool(app, client, user, monkeypatch):
+    monkeypatch.setitem(app.config, 'PHOTO_WORKERS', 1)
+    animals = [create_animal(client, name=f'Cow {i}') for i in range(3)]
+    try:
+        for animal in animals:
+            assert _upload(client, animal['id']).status_code == 202
+        statuses = [_status(client, animal['id'], wait=10) for animal in animals]
+    finally:
+        jobs.shutdown_jobs()
+    assert [status['photo_status'] for status in statuses] == ['ready'] * 3
+    # Same bytes, so the animals share one stored photo
+    assert len({status['photo_path'] for status in statuses}) == 1
+
+
+def test_raw_and_multipart_upload(client, user):
+    animal = create_animal(client)
+    response = _upload(client, animal['id'], make_photo(320, 240))
+    assert response.status_code == 202
+    assert response.get_json()['animal']['photo_status'] == 'pending'
+    status = _status(client, animal['id'], wait=5)
+    assert status['photo_status'] == 'ready'
+
+    response = client.put(f"/api/animals/{animal['id']}/photo", content_type='multipart/form-data',
+                          data={'photo': (io.BytesIO(make_photo(321, 240)), 'cow.jpg')})
+    assert response.status_code == 202
+    replaced = _status(client, animal['id'], wait=5)
+    assert replaced['photo_status'] == 'ready'
+    assert replaced['photo_path'] != status['photo_path']
+
+
+def test_upload_errors(app, client, user, monkeypatch):
+    animal = create_animal(client)
+    response = client.put(f"/api/animals/{animal['id']}/photo", content_type='multipart/form-data',
+                          data={'other': (io.BytesIO(b'x'), 'x.jpg')})
+    assert response.status_code == 400
+    assert _upload(client, 999999).status_code == 404
+
+    response = _upload(client, animal['id'], b'not an image')
+    assert response.status_code == 202
+    assert _status(client, animal['id'], wait=5)['photo_status'] == 'failed'
+
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 1024)
+    assert _upload(client, animal['id'], make_photo(800, 600)).status_code == 413
+
+
+def _uploaded_photo(client, photo):
+    animal = create_animal(client)
+    assert _upload(client, animal['id'], photo).status_code == 202
+    status = _status(client, animal['id'], wait=5)
+    assert status['photo_status'] == 'ready'
+    return animal, status['photo_path']
+
+
+def _image(response):
+    from PIL import Image
+    assert response.status_code == 200
+    return Image.open(io.BytesIO(response.get_data()))
+
+
+def test_derivative_sizes(app, client, user, monkeypatch):
+    monkeypatch.setitem(app.config, 'PHOTO_WEBP', True)
+    _, photo_path = _uploaded_photo(client, make_photo(1600, 1200))
+
+    for size, width in PHOTO_SIZES.items():
+        image = _image(client.get(f'/api/uploads/{photo_path}', query_string={'size': size}))
+        assert image.format == 'JPEG'
+        assert image.size == (width, width * 3 // 4)
+    assert _image(client.get(f'/api/uploads/{photo_path}')).width == PHOTO_SIZES['full']
+
+    response = client.get(f'/api/uploads/{photo_path}?size=thumb', headers={'Accept': 'image/webp,*/*'})
+    assert _image(response).format == 'WEBP'
+    assert 'Accept' in response.vary
+    assert client.get(f'/api/uploads/{photo_path}?size=huge').status_code == 400
+
+
+def test_small_photo_is_not_enlarged(client, user):
+    _, photo_path = _uploaded_photo(client, make_photo(300, 200))
+    assert _image(client.get(f'/api/uploads/{photo_path}?size=card')).size == (300, 200)
+    assert _image(client.get(f'/api/uploads/{photo_path}?size=thumb')).size == (160, 106)
+
+
+def test_photos_are_content_addressed_and_shared(app, client, user):
+    photo = make_photo(410, 300)
+    first, photo_path = _uploaded_photo(client, photo)
+    assert photo_path == hashlib.sha256(photo).hexdigest() + '.jpg'
+    second, shared_path = _uploaded_photo(client, photo)
+    assert shared_path == photo_path
+    with app.app_context():
+        assert db.session.get(Photo, photo_path).ref_count == 2
+
+    response = client.get(f'/api/uploads/{photo_path}?size=card')
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert response.get_etag() == (photo_variant(photo_path, 'card'), False)
+
+    # Files stay until the last animal using them is gone
+    stored = os.path.join(app.config['UPLOAD_FOLDER'], photo_path)
+    assert client.delete(f"/api/animals/{first['id']}").status_code == 200
+    assert os.path.isfile(stored)
+    assert client.delete(f"/api/animals/{second['id']}").status_code == 200
+    assert not os.path.exists(stored)
+    assert not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], photo_variant(photo_path, 'thumb')))
+    with app.app_context():
+        assert db.session.get(Photo, photo_path) is None
+
+
+def test_conditional_and_range_requests(client, user):
+    _, photo_path = _uploaded_photo(client, make_photo(420, 300))
+    url = f'/api/uploads/{photo_path}'
+    full = client.get(url)
+    assert full.accept_ranges == 'bytes'
+
+    response = client.get(url, headers={'If-None-Match': full.headers['ETag']})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+
+    response = client.get(url, headers={'Range': 'bytes=0-99'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 0-99/{len(full.get_data())}'
+    assert response.get_data() == full.get_data()[:100]
+
+
+def test_legacy_upload_is_revalidated(app, client):
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], 'legacy.jpg'), 'wb') as f:
+        f.write(make_photo(100, 100))
+    response = client.get('/api/uploads/legacy.jpg')
+    assert response.status_code == 200
+    assert 'immutable' not in response.headers['Cache-Control']
+    response = client.get('/api/uploads/legacy.jpg', headers={'If-Modified-Since': response.headers['Last-Modified']})
+    assert response.status_code == 304
+
+
+def test_x_accel_redirect(app, client, user, monkeypatch):
+    _, photo_path = _uploaded_photo(client, make_photo(430, 300))
+    monkeypatch.setitem(app.config, 'UPLOAD_SENDFILE', 'x-accel')
+    url = f'/api/uploads/{photo_path}?size=thumb'
+
+    response = client.get(url)
+    assert response.status_code == 200
+    thumb = photo_variant(photo_path, 'thumb')
+    assert response.headers['X-Accel-Redirect'] == app.config['UPLOAD_ACCEL_PREFIX'] + thumb
+    assert response.get_data() == b''
+    assert response.get_etag() == (thumb, False)
+
+    response = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+    assert 'X-Accel-Redirect' not in response.headers
+    assert client.get('/api/uploads/missing.jpg').status_code == 404
@@ -0,0 +1,52 @@
+from conftest import create_animal, register
+
+
+def _search(client, q):
+    response = client.get('/api/animals/search', query_string={'q': q})
+    assert response.status_code == 200, response.get_json()
+    return [animal['name'] for animal in response.get_json()['animals']]
+
+
+def test_search_follows_writes(client, user):
+    bella = create_animal(client, name='Bella', notes='Limping on the left leg')
+    create_animal(client, name='Daisy', injections=[{'date': '2026-02-01', 'details': 'FMD vaccine'}])
+
+    assert _search(client, 'limp') == ['Bella']
+    assert _search(client, 'fmd vacc') == ['Daisy']
+    assert _search(client, 'bella limping') == ['Bella']
+    assert _search(client, 'bella fmd') == []
+
+    # Triggers keep the index current on update, injection changes and delete
+    client.put(f"/api/animals/{bella['id']}", json={'notes': 'Healthy'})
+    assert _search(client, 'limp') == []
+    client.post(f"/api/animals/{bella['id']}/injections", json={'date': '2026-03-01', 'details': 'Deworming'})
+    assert _search(client, 'deworm') == ['Bella']
+    client.delete(f"/api/animals/{bella['id']}")
+    assert _search(client, 'deworm') == []
+
+
+def test_search_ranks_names_first_and_pages(client, user):
+    create_animal(client, name='Rani', notes='Sister of Moti')
+    create_animal(client, name='Moti')
+
+    assert _search(client, 'moti') == ['Moti', 'Rani']
+
+    first = client.get('/api/animals/search', query_string={'q': 'moti', 'limit': 1}).get_json()
+    second = client.get('/api/animals/search', query_string={'q': 'moti', 'limit': 1, 'cursor': first['next_cursor']}).get_json()
+    assert [a['name'] for a in first['animals'] + second['animals']] == ['Moti', 'Rani']
+    assert second['next_cursor'] is None
+
+
+def test_search_is_per_user(app, client, user):
+    create_animal(client, name='Bella')
+    other = app.test_client()
+    register(other)
+    assert _search(other, 'bella') == []
+    assert other.get('/api/animals/search?q=').status_code == 400
+
+
+def test_imported_animals_are_indexed(client, user):
+    body = b'{"name": "Kamdhenu", "animal_type": "Cow", "injections": [{"date": "2026-01-01", "details": "BQ vaccine"}]}\n'
+    assert client.post('/api/animals/import', data=body, content_type='application/x-ndjson').status_code == 201
+    assert _search(client, 'kamdhenu') == ['Kamdhenu']
+    assert _search(client, 'bq') == ['Kamdhenu']
@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+
+from conftest import create_animal
+
+
+def _stats(client, days=30):
+    response = client.get('/api/stats', query_string={'days': days})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_counts_follow_writes(client, user):
+    today = date.today()
+    cow = create_animal(client, type='Cow', inseminatedDate=(today - timedelta(days=270)).isoformat())
+    create_animal(client, name='Gauri', type='Goat')
+    goat = create_animal(client, name='Chhoti', type='Goat')
+
+    stats = _stats(client)
+    assert stats['total'] == 3
+    assert stats['by_type'] == {'Cow': 1, 'Goat': 2}
+    assert stats['pregnant'] == 1
+    # 283 days of gestation, 13 days to go
+    assert stats['deliveries_due'] == 1
+
+    client.put(f"/api/animals/{cow['id']}", json={'deliveryDate': today.isoformat()})
+    client.put(f"/api/animals/{goat['id']}", json={'type': 'Sheep'})
+    stats = _stats(client)
+    assert stats['pregnant'] == 0
+    assert stats['deliveries_due'] == 0
+    assert stats['by_type'] == {'Cow': 1, 'Goat': 1, 'Sheep': 1}
+
+    client.delete(f"/api/animals/{cow['id']}")
+    assert _stats(client)['by_type'] == {'Goat': 1, 'Sheep': 1}
+
+
+def test_recent_injections(client, user):
+    today = date.today()
+    create_animal(client, injections=[
+        {'date': (today - timedelta(days=3)).isoformat(), 'details': 'FMD vaccine'},
+        {'date': (today - timedelta(days=90)).isoformat(), 'details': 'HS vaccine'}
+    ])
+    recent = _stats(client, days=30)['recent_injections']
+    assert recent['total'] == 1
+    assert recent['by_details'] == [{'details': 'FMD vaccine', 'count': 1}]
+
+
+def test_reminders(client, user):
+    today = date.today()
+    cow = create_animal(client, name='Bella', type='Cow',
+                        inseminatedDate=(today - timedelta(days=280)).isoformat(),
+                        injections=[{'date': (today - timedelta(days=85)).isoformat(), 'details': 'Deworming'}])
+
+    events = client.get('/api/reminders?days=30').get_json()['events']
+    assert sorted((event['kind'], event['label']) for event in events) == [('booster', 'Deworming'), ('expected_delivery', None)]
+    assert all(event['animal_name'] == 'Bella' for event in events)
+
+    client.put(f"/api/animals/{cow['id']}", json={'injections': []})
+    events = client.get('/api/reminders?days=30').get_json()['events']
+    assert [event['kind'] for event in events] == ['expected_delivery']
@@ -0,0 +1,113 @@
+import base64
+import glob
+import os
+import tempfile
+import threading
+
+import jobs
+import routes
+from conftest import create_animal, make_photo
+
+
+def _changes(client, since=None):
+    response = client.get('/api/animals/changes', query_string={'since': since} if since else {})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_changes_since_token(client, user):
+    first = create_animal(client, name='Bella')
+    second = create_animal(client, name='Daisy')
+
+    full = _changes(client)
+    assert {animal['id'] for animal in full['animals']} == {first['id'], second['id']}
+    assert full['deleted'] == []
+
+    token = full['sync_token']
+    assert _changes(client, token)['animals'] == []
+
+    client.put(f"/api/animals/{first['id']}", json={'notes': 'Vet visit'})
+    client.delete(f"/api/animals/{second['id']}")
+    delta = _changes(client, token)
+    assert [animal['id'] for animal in delta['animals']] == [first['id']]
+    assert delta['animals'][0]['notes'] == 'Vet visit'
+    assert delta['deleted'] == [second['id']]
+
+    assert _changes(client, delta['sync_token']) == dict(delta, animals=[], deleted=[])
+
+
+def test_injection_edit_is_a_change(client, user):
+    animal = create_animal(client)
+    token = _changes(client)['sync_token']
+    client.post(f"/api/animals/{animal['id']}/injections", json={'date': '2026-04-01', 'details': 'HS vaccine'})
+    assert [a['id'] for a in _changes(client, token)['animals']] == [animal['id']]
+
+
+def test_listing_token_works_for_changes(client, user):
+    create_animal(client)
+    token = client.get('/api/animals').get_json()['sync_token']
+    created = create_animal(client, name='Later')
+    assert [a['id'] for a in _changes(client, token)['animals']] == [created['id']]
+
+
+def test_legacy_and_invalid_tokens(client, user):
+    create_animal(client)
+    from utils import encode_cursor
+    legacy = encode_cursor('2026-01-01T00:00:00')
+    assert len(_changes(client, legacy)['animals']) == 1
+    assert client.get('/api/animals/changes?since=garbage').status_code == 400
+
+
+def test_batch_replay(client, user):
+    operations = [
+        {'key': 'k1', 'op': 'create', 'data': {'name': 'Bella', 'type': 'Cow'}},
+        {'key': 'k2', 'op': 'update', 'ref': 'k1', 'data': {'notes': 'Vet visit'}},
+        {'key': 'k3', 'op': 'create', 'data': {'name': 'No type'}},
+        {'key': 'k4', 'op': 'delete', 'id': 999999}
+    ]
+    response = client.post('/api/batch', json={'operations': operations})
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [result['status'] for result in results] == [201, 200, 400, 404]
+    animal_id = results[0]['body']['animal']['id']
+    assert results[1]['body']['animal']['notes'] == 'Vet visit'
+
+    replay = client.post('/api/batch', json={'operations': operations}).get_json()['results']
+    assert all(result['replayed'] for result in replay)
+    assert [result['body'] for result in replay] == [result['body'] for result in results]
+    assert [animal['id'] for animal in client.get('/api/animals').get_json()['animals']] == [animal_id]
+
+
+def test_batch_does_not_store_retryable_errors(client, user, monkeypatch):
+    operations = [{'key': 'photo', 'op': 'create', 'data': {'name': 'Bella', 'type': 'Cow', 'photoData': 'data:image/png;base64,AAAA'}}]
+    monkeypatch.setattr(routes, 'reserve_photo_slot', lambda app: False)
+    result, = client.post('/api/batch', json={'operations': operations}).get_json()['results']
+    assert result['status'] == 503
+    assert 'replayed' not in result
+
+    monkeypatch.undo()
+    result, = client.post('/api/batch', json={'operations': operations}).get_json()['results']
+    assert 'replayed' not in result
+    assert result['status'] != 503
+
+
+def test_batch_failed_update_releases_staged_photo(client, user, monkeypatch):
+    monkeypatch.setattr(jobs, '_slots', threading.BoundedSemaphore(1))
+    animal = create_animal(client)
+    staged = set(glob.glob(os.path.join(tempfile.gettempdir(), 'naam_upload_*')))
+
+    photo = base64.b64encode(make_photo()).decode()
+    operations = [{'key': 'bad', 'op': 'update', 'id': animal['id'], 'data': {'name': None, 'photoData': photo}}]
+    result, = client.post('/api/batch', json={'operations': operations}).get_json()['results']
+    assert result['status'] == 500
+
+    # No staged file left behind and the queue slot is free again
+    assert set(glob.glob(os.path.join(tempfile.gettempdir(), 'naam_upload_*'))) <= staged
+    response = client.put(f"/api/animals/{animal['id']}/photo", data=make_photo(), content_type='image/jpeg')
+    assert response.status_code == 202
+
+
+def test_batch_validation(client, user):
+    assert client.post('/api/batch', json={'operations': 'nope'}).status_code == 400
+    duplicate = [{'key': 'a', 'op': 'delete', 'id': 1}, {'key': 'a', 'op': 'delete', 'id': 2}]
+    assert client.post('/api/batch', json={'operations': duplicate}).status_code == 400
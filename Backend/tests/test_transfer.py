@@ -0,0 +1,90 @@
+import json
+
+from conftest import create_animal, register
+
+
+def _import(client, body, content_type='application/x-ndjson'):
+    return client.post('/api/animals/import', data=body, content_type=content_type)
+
+
+def _herd(client):
+    animals = client.get('/api/animals', query_string={'include': 'injections'}).get_json()['animals']
+    return sorted(
+        (a['name'], a['animal_type'], a['notes'], a['inseminated_date'],
+         sorted((i['date'], i['details']) for i in a['injections']))
+        for a in animals
+    )
+
+
+def _seed(client):
+    create_animal(client, name='Bella', type='Cow', notes='Calm', inseminatedDate='2026-01-10',
+                  injections=[{'date': '2026-02-01', 'details': 'FMD vaccine'}])
+    create_animal(client, name='Gauri', type='Goat', notes='Has "quotes", and commas')
+
+
+def test_ndjson_round_trip(app, client, user):
+    _seed(client)
+    response = client.get('/api/animals/export')
+    assert response.mimetype == 'application/x-ndjson'
+    exported = response.get_data()
+    assert len(exported.splitlines()) == 2
+
+    other = app.test_client()
+    register(other)
+    response = _import(other, exported)
+    assert response.status_code == 201
+    assert response.get_json()['imported'] == 2
+    assert _herd(other) == _herd(client)
+
+
+def test_csv_round_trip(app, client, user):
+    _seed(client)
+    exported = client.get('/api/animals/export?format=csv').get_data()
+
+    other = app.test_client()
+    register(other)
+    assert _import(other, exported, 'text/csv').status_code == 201
+    assert _herd(other) == _herd(client)
+
+
+def test_bad_line_imports_nothing(client, user):
+    body = '\n'.join([
+        json.dumps({'name': 'Bella', 'animal_type': 'Cow'}),
+        json.dumps({'name': 'Broken', 'animal_type': 'Cow', 'inseminated_date': 'not a date'})
+    ])
+    response = _import(client, body)
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('Line 2')
+    assert client.get('/api/animals').get_json()['animals'] == []
+
+
+def test_schema_errors_import_nothing(app, client, user, monkeypatch):
+    # One per batch, so a late failure would leave the first line committed
+    monkeypatch.setitem(app.config, 'IMPORT_BATCH_SIZE', 1)
+    good = json.dumps({'name': 'Bella', 'animal_type': 'Cow'})
+    for bad, error in [
+        ({'name': 'x' * 101, 'animal_type': 'Cow'}, 'name is longer than 100 characters'),
+        ({'name': 'Bella', 'animal_type': 'Cow', 'notes': 'a\x00b'}, 'notes contains a NUL character'),
+        ({'name': 'Bella', 'animal_type': 'Cow', 'notes': {'a': 1}}, 'notes must be text'),
+        ({'name': 'Bella', 'animal_type': 'Cow', 'injections': [{'date': '2026-01-01', 'details': None}]}, 'details is required')
+    ]:
+        response = _import(client, good + '\n' + json.dumps(bad))
+        assert response.status_code == 400
+        assert response.get_json()['error'] == f'Line 2: {error}'
+    assert client.get('/api/animals').get_json()['animals'] == []
+
+
+def test_import_in_batches(app, client, user, monkeypatch):
+    monkeypatch.setitem(app.config, 'IMPORT_BATCH_SIZE', 3)
+    token = client.get('/api/animals/changes').get_json()['sync_token']
+    body = '\n'.join(
+        json.dumps({'name': f'Cow {i}', 'animal_type': 'Cow', 'injections': [{'date': '2026-05-01', 'details': 'HS vaccine'}]})
+        for i in range(7)
+    )
+    response = _import(client, body)
+    assert response.get_json()['imported'] == 7
+
+    changes = client.get('/api/animals/changes', query_string={'since': token}).get_json()
+    assert len(changes['animals']) == 7
+    assert all(len(animal['injections']) == 1 for animal in changes['animals'])
+    assert client.get('/api/stats').get_json()['by_type'] == {'Cow': 7}
@@ -0,0 +1,195 @@
+import csv
+import io
+import json
+import shutil
+import tempfile
+from datetime import date, datetime
+from sqlalchemy import String, insert
+from models import db, Animal, Injection
+from serializers import animal_select, attach_injections, dumps
+from cache import bump_versions
+from reminders import mark_changed
+from stats import count_new_animals
+
+# Herd export and import. Records use the Animal.to_dict() field names, so
+# an export can be imported again as is. Both directions stream: exports
+# are generated from a server-side cursor and imports are parsed line by
+# line and inserted in committed batches, so memory does not grow with
+# herd size.
+
+CSV_COLUMNS = [
+    'id', 'name', 'animal_type', 'photo_path', 'photo_status',
+    'inseminated_date', 'delivery_date', 'calf_details', 'notes',
+    'created_at', 'updated_at', 'injections'
+]
+
+def export_animals(user_id, fmt='ndjson', chunk_size=1000):
+    """Generate an export of a user's herd, oldest first, in text chunks"""
+    if fmt != 'csv':
+        for records in _export_chunks(user_id, chunk_size):
+            yield ''.join(dumps(record) + '\n' for record in records)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for records in _export_chunks(user_id, chunk_size):
+        for record in records:
+            record['injections'] = dumps(record['injections'])
+            writer.writerow([_csv_value(record[column]) for column in CSV_COLUMNS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def _export_chunks(user_id, chunk_size):
+    """Lists of animal dicts with injections, read through a server-side cursor"""
+    statement = (
+        animal_select()
+        .where(Animal.user_id == user_id)
+        .order_by(Animal.created_at, Animal.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    for partition in db.session.execute(statement).mappings().partitions():
+        records = [dict(row) for row in partition]
+        attach_injections(records)
+        yield records
+
+def _csv_value(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+def import_animals(user_id, stream, fmt='ndjson', batch_size=1000):
+    """Insert the animals read from a binary stream, returns how many
+
+    The upload is first spooled to a temporary file and checked in full, so
+    a ValueError (naming the offending line) means nothing was written.
+    It is then inserted and committed a batch at a time, so the write lock
+    is held per batch and each batch gets current timestamps and change
+    versions for delta sync.
+    """
+    with tempfile.TemporaryFile() as spool:
+        shutil.copyfileobj(stream, spool, 64 * 1024)
+
+        spool.seek(0)
+        for line, record in _records(spool, fmt):
+            try:
+                _animal_row(user_id, record, None)
+                _injection_rows(record.get('injections'))
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"Line {line}: {e}")
+
+        spool.seek(0)
+        count = 0
+        batch = []
+        for _, record in _records(spool, fmt):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                count += _insert_batch(user_id, batch)
+        count += _insert_batch(user_id, batch)
+    return count
+
+def _records(spool, fmt):
+    """(line, record) pairs read from a binary file, which is left open"""
+    text = io.TextIOWrapper(spool, encoding='utf-8', newline='' if fmt == 'csv' else None)
+    try:
+        yield from _read_csv(text) if fmt == 'csv' else _read_ndjson(text)
+    finally:
+        text.detach()
+
+def _read_ndjson(text):
+    for line, raw in enumerate(text, start=1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError as e:
+            raise ValueError(f"Line {line}: {e}")
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {line}: expected a JSON object")
+        yield line, record
+
+def _read_csv(text):
+    reader = csv.DictReader(text)
+    for record in reader:
+        line = reader.line_num
+        if record.get('injections'):
+            try:
+                record['injections'] = json.loads(record['injections'])
+            except ValueError as e:
+                raise ValueError(f"Line {line}: injections: {e}")
+        yield line, {key: value for key, value in record.items() if value != ''}
+
+def _animal_row(user_id, record, now):
+    if not record.get('name') or not record.get('animal_type'):
+        raise ValueError('name and animal_type are required')
+    return _checked(Animal.__table__, {
+        'user_id': user_id,
+        'name': record['name'],
+        'animal_type': record['animal_type'],
+        'inseminated_date': _parse_date(record.get('inseminated_date')),
+        'delivery_date': _parse_date(record.get('delivery_date')),
+        'calf_details': record.get('calf_details'),
+        'notes': record.get('notes'),
+        'created_at': datetime.fromisoformat(record['created_at']) if record.get('created_at') else now,
+        'updated_at': now
+    })
+
+def _injection_rows(injections):
+    return [
+        _checked(Injection.__table__, {'date': date.fromisoformat(inj['date']), 'details': inj['details']})
+        for inj in injections or []
+    ]
+
+def _checked(table, row):
+    """Return row, or raise ValueError for a value the table would reject
+
+    Covers NOT NULL, text type and length, and NUL characters (refused by
+    PostgreSQL), so the check pass catches what an insert would fail on.
+    """
+    for name, value in row.items():
+        column = table.c[name]
+        if value is None:
+            if not column.nullable:
+                raise ValueError(f'{name} is required')
+        elif isinstance(column.type, String):
+            if not isinstance(value, str):
+                raise ValueError(f'{name} must be text')
+            if column.type.length and len(value) > column.type.length:
+                raise ValueError(f'{name} is longer than {column.type.length} characters')
+            if '\x00' in value:
+                raise ValueError(f'{name} contains a NUL character')
+    return row
+
+def _parse_date(value):
+    return date.fromisoformat(value) if value else None
+
+def _insert_batch(user_id, records):
+    """Insert and commit one batch of records, then clear the list"""
+    if not records:
+        return 0
+
+    # Bumped first so the rows carry the version this commit makes visible
+    version = bump_versions(db.session, {user_id})[user_id]
+    now = datetime.utcnow()
+    animals = [dict(_animal_row(user_id, record, now), change_version=version) for record in records]
+
+    # RETURNING hands the new ids back in row order to link the injections
+    animal_ids = db.session.scalars(
+        insert(Animal).returning(Animal.id, sort_by_parameter_order=True),
+        animals
+    ).all()
+
+    injection_rows = [
+        dict(inj, animal_id=animal_id, created_at=now)
+        for animal_id, record in zip(animal_ids, records)
+        for inj in _injection_rows(record.get('injections'))
+    ]
+    if injection_rows:
+        db.session.execute(insert(Injection), injection_rows)
+    mark_changed(db.session, animal_ids)
+    count_new_animals(db.session, animals)
+    db.session.commit()
+
+    count = len(records)
+    records.clear()
+    return count
@@ -1,22 +1,21 @@
 import os
 from werkzeug.utils import secure_filename
-from PIL import Image
 import base64
+import hashlib
+import tempfile
 from io import BytesIO
 import random
+import secrets
 import string
 import re
-from flask_mail import Mail, Message
-
-mail = Mail()
 
 def allowed_file(filename, allowed_extensions):
     """Check if file extension is allowed"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
-def save_base64_image(base64_string, upload_folder, filename_prefix='animal'):
-    """Save base64 encoded image to file"""
+def stage_base64_upload(base64_string):
+    """Decode a base64 image into a staged temp file and return its path"""
     try:
         # Remove data URL prefix if present
         if ',' in base64_string:
@@ -24,33 +23,123 @@ def save_base64_image(base64_string, upload_folder, filename_prefix='animal'):
         
         # Decode base64
         image_data = base64.b64decode(base64_string)
-        image = Image.open(BytesIO(image_data))
+        return stage_upload(BytesIO(image_data))
+    except Exception as e:
+        print(f"Error staging image: {e}")
+        return None
+
+def stage_upload(stream, chunk_size=64 * 1024):
+    """Copy an upload stream to a temp file in chunks and return its path
+
+    The caller owns the file and must delete it once it has been processed.
+    """
+    fd, path = tempfile.mkstemp(prefix='naam_upload_')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                tmp.write(chunk)
+    except Exception:
+        # e.g. RequestEntityTooLarge part way through
+        os.remove(path)
+        raise
+    return path
+
+# Photo derivatives by name and max width; 'full' keeps the stored filename
+PHOTO_SIZES = {'full': 1200, 'card': 480, 'thumb': 160}
+
+def photo_variant(filename, size='full', extension='jpg'):
+    """Filename of a stored photo's derivative at the given size and format"""
+    stem = filename.rsplit('.', 1)[0]
+    suffix = '' if size == 'full' else f'_{size}'
+    return f"{stem}{suffix}.{extension}"
+
+def process_image(source_path, upload_folder, webp=False):
+    """Turn a staged upload into a stored photo (runs in the photo worker pool)
+
+    Photos are stored under the SHA-256 of the uploaded bytes, so uploading
+    the same photo again reuses the files that are already there.
+    """
+    digest = hashlib.sha256()
+    with open(source_path, 'rb') as source:
+        for chunk in iter(lambda: source.read(64 * 1024), b''):
+            digest.update(chunk)
+        filename = f"{digest.hexdigest()}.jpg"
         
-        # Generate unique filename
-        from datetime import datetime
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{filename_prefix}_{timestamp}.jpg"
-        filepath = os.path.join(upload_folder, filename)
+        stored = [photo_variant(filename)]
+        if webp:
+            stored.append(photo_variant(filename, extension='webp'))
+        if all(os.path.isfile(os.path.join(upload_folder, name)) for name in stored):
+            return filename
         
-        # Resize image if too large (max 1200px width)
-        max_width = 1200
-        if image.width > max_width:
-            ratio = max_width / image.width
-            new_size = (max_width, int(image.height * ratio))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
+        source.seek(0)
+        return save_image_file(source, upload_folder, filename, webp)
+
+def save_image_file(fileobj, upload_folder, filename, webp=False):
+    """Save an image read from a file object as JPEG at every PHOTO_SIZES width
+
+    With webp set, a WebP copy of each size is written alongside. Files are
+    moved into place only once all sizes are written. Returns filename, or
+    None if the data is not a readable image.
+    """
+    # Pillow is only loaded where photos are processed, not at app startup
+    from PIL import Image
+    
+    # Uploads of the same photo share a filename, so each save gets its own
+    # temporary names
+    suffix = f'.{secrets.token_hex(8)}.tmp'
+    written = []
+    try:
+        image = Image.open(fileobj)
+        
+        # Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding
+        max_width = PHOTO_SIZES['full']
+        if image.format == 'JPEG' and image.width > max_width:
+            image.draft('RGB', (max_width, int(image.height * max_width / image.width)))
         
         # Convert to RGB if necessary
-        if image.mode in ('RGBA', 'LA', 'P'):
+        if image.mode != 'RGB':
             image = image.convert('RGB')
         
-        # Save image
-        image.save(filepath, 'JPEG', quality=85, optimize=True)
+        # Each size is resized from the previous, larger one
+        for size, width in sorted(PHOTO_SIZES.items(), key=lambda item: -item[1]):
+            if image.width > width:
+                new_size = (width, max(1, int(image.height * width / image.width)))
+                image = image.resize(new_size, Image.Resampling.LANCZOS)
+            
+            formats = [('jpg', 'JPEG', {'quality': 85, 'optimize': True})]
+            if webp:
+                formats.append(('webp', 'WEBP', {'quality': 80}))
+            for extension, image_format, options in formats:
+                path = os.path.join(upload_folder, photo_variant(filename, size, extension))
+                image.save(path + suffix, image_format, **options)
+                written.append(path)
+        
+        # Smallest first, so the full-size file appearing means the set is complete
+        for path in reversed(written):
+            os.replace(path + suffix, path)
         
         return filename
     except Exception as e:
         print(f"Error saving image: {e}")
+        for path in written:
+            delete_file(path + suffix)
         return None
 
+def is_content_addressed(filename):
+    """Whether a stored upload is named by its content hash and never changes"""
+    return re.match(r'^[0-9a-f]{64}(_[a-z]+)?\.[a-z]+$', filename) is not None
+
+def delete_photo(upload_folder, filename):
+    """Delete a stored photo together with all of its derivatives"""
+    if not filename:
+        return
+    for size in PHOTO_SIZES:
+        for extension in ('jpg', 'webp'):
+            delete_file(os.path.join(upload_folder, photo_variant(filename, size, extension)))
+
 def delete_file(filepath):
     """Delete a file if it exists"""
     try:
@@ -61,17 +150,27 @@ def delete_file(filepath):
         print(f"Error deleting file: {e}")
     return False
 
+def encode_cursor(*values):
+    """Encode values into an opaque, URL-safe pagination cursor"""
+    raw = '|'.join(str(value) for value in values)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor into its string parts"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        return base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8').split('|')
+    except Exception:
+        raise ValueError('Invalid cursor')
+
 def generate_verification_code():
     """Generate 6-digit verification code"""
     return ''.join(random.choices(string.digits, k=6))
 
 def send_verification_email(email, code, name):
-    """Send verification code via email"""
-    try:
-        msg = Message(
-            subject='NAAM - Your Verification Code',
-            recipients=[email],
-            body=f'''Hello {name},
+    """Queue the verification code email (sent once the caller commits)"""
+    from outbox import enqueue_email
+    enqueue_email(email, 'NAAM - Your Verification Code', f'''Hello {name},
 
 Welcome to NAAM Farm Animal Tracker!
 
@@ -81,40 +180,14 @@ This code will expire in 10 minutes.
 
 Thank you,
 NAAM Team
-'''
-        )
-        mail.send(msg)
-        return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
+''')
+    return True
 
 def send_verification_sms(mobile, code, name):
-    """Send verification code via SMS using Twilio"""
-    try:
-        from twilio.rest import Client
-        from flask import current_app
-        
-        account_sid = current_app.config['TWILIO_ACCOUNT_SID']
-        auth_token = current_app.config['TWILIO_AUTH_TOKEN']
-        twilio_number = current_app.config['TWILIO_PHONE_NUMBER']
-        
-        if not account_sid or not auth_token:
-            print("Twilio credentials not configured")
-            return False
-        
-        client = Client(account_sid, auth_token)
-        
-        message = client.messages.create(
-            body=f'Hello {name}, your NAAM verification code is: {code}. Valid for 10 minutes.',
-            from_=twilio_number,
-            to=mobile
-        )
-        
-        return True
-    except Exception as e:
-        print(f"Error sending SMS: {e}")
-        return False
+    """Queue the verification code SMS (sent once the caller commits)"""
+    from outbox import enqueue_sms
+    enqueue_sms(mobile, f'Hello {name}, your NAAM verification code is: {code}. Valid for 10 minutes.')
+    return True
 
 def is_valid_email(value):
     """Check if value is a valid email"""
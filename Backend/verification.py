@@ -0,0 +1,44 @@
+import hmac
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, or_
+from models import db, VerificationCode
+from utils import generate_verification_code
+
+# Verification codes live in their own table, one row per user, and stop
+# working after VERIFICATION_CODE_TTL seconds or VERIFICATION_MAX_ATTEMPTS
+# wrong guesses. Rows are written in the caller's transaction, so a code
+# exists exactly when its outbox email does.
+
+
+def issue_code(user_id):
+    """Replace the user's code with a new one, returns it (the caller commits)"""
+    now = datetime.utcnow()
+    # Expired codes of other users are cleared on the way
+    db.session.execute(delete(VerificationCode).where(or_(
+        VerificationCode.user_id == user_id, VerificationCode.expires_at <= now
+    )))
+    code = generate_verification_code()
+    db.session.add(VerificationCode(
+        user_id=user_id, code=code,
+        expires_at=now + timedelta(seconds=current_app.config['VERIFICATION_CODE_TTL'])
+    ))
+    return code
+
+def check_code(user_id, code):
+    """'valid', 'invalid' or 'expired'; a valid code is used up (the caller commits)"""
+    row = db.session.get(VerificationCode, user_id)
+    if row is None or row.expires_at <= datetime.utcnow():
+        if row is not None:
+            db.session.delete(row)
+        return 'expired'
+
+    # Bytes, as compare_digest refuses non-ASCII str
+    if not hmac.compare_digest(row.code.encode(), str(code).encode()):
+        row.attempts += 1
+        if row.attempts >= current_app.config['VERIFICATION_MAX_ATTEMPTS']:
+            db.session.delete(row)
+        return 'invalid'
+
+    db.session.delete(row)
+    return 'valid'